@@ -0,0 +1,297 @@
+"""
+Benchmark every extractor generation over the bundled scenario timelines.
+
+Each extractor runs through the processor's extract_table on every CSV,
+parsing every row with a cold URL cache, so the extractors are compared
+like for like; the current extractor is also reported with its source
+prefilter, as the processor runs it. The harness reports throughput, matched rows, distinct states and transitions,
+peak memory, and how the output differs from the current extractor. Results
+are stored as JSON so runs can be compared between versions.
+
+Run from the repository root:
+
+    python -m benchmark.extractors [--csv-dir DIR] [--repeat N] [--output-dir DIR]
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from machine_source.processor import extract_table, read_rows
+from script.legacy.domain import domain_extract
+from script.legacy.dynamic import dynamic_extract
+from script.legacy.search import search_focused_extract
+from script.legacy.search_download import improved_search_extract
+from script.legacy.url import url_extract
+from script.legacy.web_activity import web_activity_extract as legacy_web_activity_extract
+from script.legacy.web_activity_2 import browser_activity_extract
+from script.web_activity_script import configure_url_cache, web_activity_extract
+
+# ==== CONSTANTS ====
+DEFAULT_CSV_DIR = "raw_data/scenarios_pak_hudan"
+DEFAULT_OUTPUT_DIR = "benchmark/results"
+DEFAULT_REPEAT = 3
+CURRENT_EXTRACTOR = "web_activity_script"
+PREFILTERED_EXTRACTOR = f"{CURRENT_EXTRACTOR} (prefilter)"
+DIFF_EXAMPLES = 5
+# Large enough for any timeline field; csv takes a C long, 32 bits on Windows
+CSV_FIELD_LIMIT = min(sys.maxsize, 2**31 - 1)
+
+
+# ==== EXTRACTORS ====
+# Legacy extractors take the message (and web_activity_2 the source_long)
+# instead of the row dict the processor passes
+
+
+def _message(row):
+    return row.get("message") or ""
+
+
+def _legacy_web_activity(row):
+    return legacy_web_activity_extract(_message(row))
+
+
+def _legacy_web_activity_2(row):
+    return browser_activity_extract(_message(row), row.get("source_long"))
+
+
+def _legacy_search(row):
+    return search_focused_extract(_message(row))
+
+
+def _legacy_search_download(row):
+    return improved_search_extract(_message(row))
+
+
+def _legacy_dynamic(row):
+    return dynamic_extract(_message(row))
+
+
+def _legacy_domain(row):
+    return domain_extract(_message(row))
+
+
+def _legacy_url(row):
+    return url_extract(_message(row))
+
+
+EXTRACTORS = {
+    CURRENT_EXTRACTOR: web_activity_extract,
+    "legacy/web_activity": _legacy_web_activity,
+    "legacy/web_activity_2": _legacy_web_activity_2,
+    "legacy/search": _legacy_search,
+    "legacy/search_download": _legacy_search_download,
+    "legacy/dynamic": _legacy_dynamic,
+    "legacy/domain": _legacy_domain,
+    "legacy/url": _legacy_url,
+}
+
+
+def extractor_runs():
+    """Yield (name, extractor, prefilter) for every measured run."""
+    for name, extract_function in EXTRACTORS.items():
+        yield name, extract_function, False
+    yield PREFILTERED_EXTRACTOR, web_activity_extract, True
+
+
+# ==== MEASUREMENT ====
+
+
+def count_records(input_csv):
+    """Count the records of a timeline."""
+    return sum(1 for _ in read_rows(input_csv))
+
+
+def measure(input_csv, extract_function, repeat, prefilter=False):
+    """
+    Extract a timeline repeat times and once more under tracemalloc.
+
+    Every pass starts with an empty URL cache, so no pass reuses the
+    classifications of an earlier pass or file.
+
+    :return: Tuple of (table, best seconds, peak traced bytes).
+    """
+    best = None
+    for _ in range(repeat):
+        configure_url_cache()
+        start = time.perf_counter()
+        table = extract_table(input_csv, extract_function, prefilter)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    configure_url_cache()
+    tracemalloc.start()
+    try:
+        table = extract_table(input_csv, extract_function, prefilter)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return table, best, peak
+
+
+def diff_output(table, reference):
+    """Compare the states and transitions of a table to the reference table."""
+    states, reference_states = set(table.states()), set(reference.states())
+    transitions, reference_transitions = set(table.transitions()), set(reference.transitions())
+
+    def examples(values):
+        return [list(value) if isinstance(value, tuple) else value
+                for value in sorted(values)[:DIFF_EXAMPLES]]
+
+    return {
+        "identical": states == reference_states and transitions == reference_transitions,
+        "extra_states": len(states - reference_states),
+        "missing_states": len(reference_states - states),
+        "extra_transitions": len(transitions - reference_transitions),
+        "missing_transitions": len(reference_transitions - transitions),
+        "examples": {
+            "extra_states": examples(states - reference_states),
+            "missing_states": examples(reference_states - states),
+        },
+    }
+
+
+def benchmark_file(input_csv, repeat):
+    """Run every extractor over one timeline; return its result entries."""
+    records = count_records(input_csv)
+    results, tables = {}, {}
+
+    for name, extract_function, prefilter in extractor_runs():
+        try:
+            table, seconds, peak = measure(input_csv, extract_function, repeat, prefilter)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+
+        tables[name] = table
+        results[name] = {
+            "records": records,
+            "rows_extracted": table.rows,
+            "matched": table.matched,
+            "states": len(table.state_ids),
+            "transitions": len(table.edge_sources),
+            "seconds": seconds,
+            "rows_per_second": records / seconds if seconds else None,
+            "peak_memory_bytes": peak,
+        }
+
+    reference = tables.get(CURRENT_EXTRACTOR)
+    if reference is not None:
+        for name, table in tables.items():
+            results[name]["diff"] = diff_output(table, reference)
+    return results
+
+
+# ==== REPORTING ====
+
+
+def git_revision():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(files):
+    """Aggregate the per-file results of every extractor."""
+    totals = {}
+    for results in files.values():
+        for name, result in results.items():
+            total = totals.setdefault(name, {
+                "files": 0, "failed": 0, "records": 0, "matched": 0, "states": 0,
+                "transitions": 0, "seconds": 0.0, "peak_memory_bytes": 0, "identical": 0})
+            if "error" in result:
+                total["failed"] += 1
+                continue
+            total["files"] += 1
+            for key in ("records", "matched", "states", "transitions", "seconds"):
+                total[key] += result[key]
+            total["peak_memory_bytes"] = max(total["peak_memory_bytes"], result["peak_memory_bytes"])
+            total["identical"] += bool(result.get("diff", {}).get("identical"))
+
+    for total in totals.values():
+        total["rows_per_second"] = total["records"] / total["seconds"] if total["seconds"] else None
+    return totals
+
+
+def print_report(summary, previous=None):
+    """Print the summary table, with the throughput change against a previous run."""
+    previous = previous or {}
+    width = max(len(name) for name in summary)
+    print(f"\n{'Extractor':<{width}}  {'Files':>5}  {'Rows/s':>10}  {'Change':>7}  {'Matched':>7}  "
+          f"{'States':>6}  {'Trans.':>6}  {'Peak KiB':>8}  {'Same as current':>15}")
+    for name, total in summary.items():
+        rate = total["rows_per_second"]
+        before = previous.get(name, {}).get("rows_per_second")
+        change = f"{rate / before - 1:+.0%}" if rate and before else "-"
+        failed = f" ({total['failed']} failed)" if total["failed"] else ""
+        print(f"{name:<{width}}  {total['files']:>5}  {rate or 0:>10,.0f}  {change:>7}  "
+              f"{total['matched']:>7}  {total['states']:>6}  {total['transitions']:>6}  "
+              f"{total['peak_memory_bytes'] / 1024:>8.0f}  "
+              f"{total['identical']:>6}/{total['files']:<8}{failed}")
+
+
+def latest_result(output_dir):
+    """Load the most recent stored result, or None if there is none."""
+    paths = sorted(glob.glob(os.path.join(output_dir, "extractors-*.json")))
+    if not paths:
+        return None
+    with open(paths[-1], "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv-dir", default=DEFAULT_CSV_DIR)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    args = parser.parse_args()
+    # For the whole run, as several timelines have fields above the default limit
+    csv.field_size_limit(CSV_FIELD_LIMIT)
+
+    csv_files = sorted(glob.glob(os.path.join(args.csv_dir, "*.csv")))
+    if not csv_files:
+        print(f"No CSV files found in {args.csv_dir}.")
+        return
+
+    files = {}
+    for input_csv in csv_files:
+        print(f"Benchmarking {input_csv}...")
+        files[os.path.basename(input_csv)] = benchmark_file(input_csv, args.repeat)
+
+    summary = summarize(files)
+    previous = latest_result(args.output_dir)
+    print_report(summary, previous["summary"] if previous else None)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    now = datetime.now()
+    result = {
+        "timestamp": now.isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "prefiltered": [PREFILTERED_EXTRACTOR],
+        "extractor_versions": {name: getattr(function, "version", None)
+                               for name, function in EXTRACTORS.items()},
+        "summary": summary,
+        "files": files,
+    }
+    output = os.path.join(args.output_dir, f"extractors-{now:%Y%m%d-%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=4)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
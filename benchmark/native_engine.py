@@ -0,0 +1,115 @@
+"""
+Benchmark trigger throughput of the native engine against transitions.
+
+The same random walk is replayed on a NativeMachine, a lightweight Base
+and, for machines small enough to build one, a full GraphMachine Base.
+The walk picks a random trigger available from the current state and
+jumps to a random state through set_state when there is none.
+
+Run from the repository root:
+
+    python -m benchmark.native_engine [machine_file] [events]
+
+Without a machine file the largest machine under machine_source is used.
+"""
+
+import random
+import sys
+import time
+
+from machine_model.base import Base
+from machine_model.builder import LIGHTWEIGHT_MIN_STATES
+from machine_model.factory import MachineFactory
+from machine_model.native import load_native_machine
+from machine_source.machine_format import load_machine_file
+
+DEFAULT_EVENTS = 200000
+SEED = 0
+
+
+def largest_machine():
+    """Return the path of the machine with the most transitions, or None."""
+    entries = [entry for entry in MachineFactory.catalog()
+               if entry.machine_type != "NarcolepticSuperheroes"]
+    if not entries:
+        return None
+    return max(entries, key=lambda entry: entry.transition_count).path
+
+
+def random_walk(machine, events):
+    """Record a random walk as trigger names, with None for set_state jumps."""
+    rnd = random.Random(SEED)
+    walk = []
+    for _ in range(events):
+        triggers = machine.get_triggers(machine.state)
+        if triggers:
+            trigger = rnd.choice(triggers)
+            machine.trigger(trigger)
+            walk.append(trigger)
+        else:
+            state = rnd.choice(machine.states)
+            machine.set_state(state)
+            walk.append((state,))
+    return walk
+
+
+def replay(machine, walk):
+    """Replay a walk; return the elapsed seconds."""
+    machine.set_state(machine.initial_state)
+    trigger = machine.trigger
+    start = time.perf_counter()
+    for step in walk:
+        if step.__class__ is str:
+            trigger(step)
+        else:
+            machine.set_state(step[0])
+    return time.perf_counter() - start
+
+
+def timed_build(build):
+    start = time.perf_counter()
+    machine = build()
+    return machine, time.perf_counter() - start
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else largest_machine()
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_EVENTS
+    if path is None:
+        print("No machines found in machine_source.")
+        return
+
+    machine_type, configs = next(iter(load_machine_file(path).items()))
+    config = configs[0]
+    print(f"Machine: {config['name']} ({len(config['states'])} states, "
+          f"{len(config['transitions'])} transitions) from {path}")
+
+    native, native_build = timed_build(lambda: load_native_machine(path, machine_type))
+    walk = random_walk(native, events)
+    engines = [("native", native, native_build)]
+
+    def base(lightweight):
+        return Base(config["name"], config["states"], config["transitions"],
+                    config["functions"], config["initial_state"], lightweight)
+
+    engines.append(("transitions (lightweight)",) + timed_build(lambda: base(True)))
+    if len(config["states"]) <= LIGHTWEIGHT_MIN_STATES:
+        engines.append(("transitions (GraphMachine)",) + timed_build(lambda: base(False)))
+    else:
+        print(f"Skipping the GraphMachine build above {LIGHTWEIGHT_MIN_STATES} states.")
+
+    # How many times faster the native engine fires events than each engine
+    print(f"\n{'Engine':<26}  {'Build (s)':>9}  {'Events/s':>12}  {'Native is':>16}")
+    native_rate = None
+    for name, machine, build in engines:
+        seconds = replay(machine, walk)
+        rate = len(walk) / seconds if seconds else float("inf")
+        if native_rate is None:
+            native_rate, speedup = rate, "-"
+        else:
+            speedup = f"{native_rate / rate:.1f}x faster"
+        print(f"{name:<26}  {build:>9.3f}  {rate:>12,.0f}  {speedup:>16}")
+
+
+if __name__ == "__main__":
+    main()
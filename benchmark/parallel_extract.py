@@ -0,0 +1,117 @@
+"""
+Check that chunked parallel extraction matches single-process extraction.
+
+Every CSV is extracted once by one process and once split into byte
+ranges on a process pool, whose StateTables are stitched back together
+with StateTable.merge. Both tables are written with write_machine_files,
+and the JSON and binary machines must be byte-identical. Chunks are made
+small enough for the bundled scenario timelines to split into many.
+
+Run from the repository root:
+
+    python -m benchmark.parallel_extract [--workers N] [--chunk-size BYTES] [path ...]
+
+Paths are CSV files or directories of them; the scenarios are used by
+default. Exits with status 1 if any output differs.
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from machine_source import processor
+from machine_source.machine_format import binary_path
+from machine_source.processor import extract_table, write_machine_files
+from script.web_activity_script import web_activity_extract
+
+# ==== CONSTANTS ====
+DEFAULT_CSV_DIR = "raw_data/scenarios_pak_hudan"
+DEFAULT_WORKERS = 4
+# Smallest byte range a chunk is cut to; the processor's own minimum of
+# 1 MiB would leave most scenario timelines in one chunk
+DEFAULT_CHUNK_SIZE = 4 << 10
+
+
+def csv_files(paths):
+    """Expand the given files and directories into a sorted list of CSV files."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.csv"))))
+        else:
+            files.append(path)
+    return files
+
+
+def machine_bytes(directory, label, table):
+    """Write the machine of a table and return the bytes of its JSON and binary files."""
+    output_json = os.path.join(directory, f"{label}.json")
+    with redirect_stdout(io.StringIO()):
+        write_machine_files(output_json, "parallel_extract", table)
+    outputs = []
+    for path in (output_json, binary_path(output_json)):
+        with open(path, "rb") as file:
+            outputs.append(file.read())
+    return outputs
+
+
+def compare(input_csv, workers, directory):
+    """
+    Extract a CSV sequentially and in parallel and compare the machines.
+
+    :return: Tuple of (identical, chunk count, sequential seconds,
+        parallel seconds, state count).
+    """
+    _, start = processor.read_header(input_csv)
+    quoted = processor.timeline_format(input_csv) == processor.CSV_FORMAT
+    chunks = len(processor.chunk_offsets(
+        input_csv, start, workers * processor.CHUNKS_PER_WORKER, quoted)) - 1
+
+    started = time.perf_counter()
+    sequential = extract_table(input_csv, web_activity_extract, workers=1)
+    sequential_time = time.perf_counter() - started
+    started = time.perf_counter()
+    parallel = extract_table(input_csv, web_activity_extract, workers=workers)
+    parallel_time = time.perf_counter() - started
+
+    identical = (machine_bytes(directory, "sequential", sequential) ==
+                 machine_bytes(directory, "parallel", parallel)
+                 and sequential.rows == parallel.rows)
+    return identical, chunks, sequential_time, parallel_time, len(sequential)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_CSV_DIR])
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    files = csv_files(args.paths)
+    if not files:
+        print(f"No CSV files found in {', '.join(args.paths)}")
+        return
+
+    processor.MIN_CHUNK_SIZE = args.chunk_size
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for input_csv in files:
+            identical, chunks, sequential_time, parallel_time, states = compare(
+                input_csv, args.workers, directory)
+            failures += not identical
+            print(f"{'OK  ' if identical else 'DIFF'} {input_csv}: {chunks} chunks, "
+                  f"{states} states, {sequential_time:.3f}s sequential, "
+                  f"{parallel_time:.3f}s with {args.workers} workers")
+
+    print(f"{len(files) - failures}/{len(files)} files identical")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
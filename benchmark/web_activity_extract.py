@@ -0,0 +1,98 @@
+"""
+Micro-benchmark of web_activity_extract over the bundled scenario timelines.
+
+The current extractor is timed against the original row extractor, kept as
+script/legacy/web_activity_3.py, on the same rows. Every pass of the
+current extractor starts with an empty URL cache, and it is timed once more
+with the cache disabled, so the passes measure the message parsing and URL
+classification rather than cache hits. Both extractors must return the
+same (state, trigger) for every row.
+
+Run from the repository root:
+
+    python -m benchmark.web_activity_extract [csv_dir] [repeat]
+"""
+
+import csv
+import glob
+import os
+import sys
+import time
+
+from script.legacy.web_activity_3 import web_activity_extract as original_web_activity_extract
+from script.web_activity_script import (URL_CACHE_SIZE, configure_url_cache, url_cache_info,
+                                        web_activity_extract)
+
+DEFAULT_CSV_DIR = "raw_data/scenarios_pak_hudan"
+DEFAULT_REPEAT = 200
+# Large enough for any timeline field; csv takes a C long, 32 bits on Windows
+CSV_FIELD_LIMIT = min(sys.maxsize, 2**31 - 1)
+
+
+def load_rows(csv_dir):
+    """Load the rows of every CSV in csv_dir that web_activity_extract inspects."""
+    csv.field_size_limit(CSV_FIELD_LIMIT)
+    sources = web_activity_extract.sources
+    rows = []
+    for path in sorted(glob.glob(os.path.join(csv_dir, "*.csv"))):
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            rows.extend(row for row in csv.DictReader(file) if row.get("source") in sources)
+    return rows
+
+
+def count_differences(rows):
+    """Count the rows the current and the original extractor disagree on."""
+    configure_url_cache()
+    return sum(1 for row in rows
+               if web_activity_extract(row) != original_web_activity_extract(row))
+
+
+def run(rows, repeat, extract_function, cache_size=None):
+    """
+    Time repeat passes of an extraction function over rows.
+
+    :param cache_size: URL cache size the current extractor starts every
+        pass with, emptied; None leaves the cache alone.
+    :return: Tuple of (seconds per row of the fastest pass, matched rows).
+    """
+    matched = sum(1 for row in rows if extract_function(row))
+    best = None
+    for _ in range(repeat):
+        if cache_size is not None:
+            configure_url_cache(cache_size)
+        start = time.perf_counter()
+        for row in rows:
+            extract_function(row)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(rows), matched
+
+
+def main():
+    csv_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CSV_DIR
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_REPEAT
+
+    rows = load_rows(csv_dir)
+    if not rows:
+        print(f"No {', '.join(web_activity_extract.sources)} rows found in {csv_dir}")
+        return
+
+    differences = count_differences(rows)
+    original, matched = run(rows, repeat, original_web_activity_extract)
+    cold, _ = run(rows, repeat, web_activity_extract, URL_CACHE_SIZE)
+    cache_info = url_cache_info()
+    uncached, _ = run(rows, repeat, web_activity_extract, 0)
+    configure_url_cache()
+
+    print(f"Rows: {len(rows)} ({matched} matched), fastest of {repeat} passes")
+    print(f"Rows extracted differently from the original: {differences}")
+    print(f"URL cache: {cache_info['hits']} hits, {cache_info['misses']} misses "
+          f"({cache_info['hit_rate']:.0%}) in a pass started empty")
+    for label, per_row in (("original", original), ("current, cold cache", cold),
+                           ("current, no cache", uncached)):
+        print(f"{label:>20}: {per_row * 1e6:.3f} us/row, {1 / per_row:,.0f} rows/s, "
+              f"{original / per_row:.2f}x the original")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+from weakref import WeakKeyDictionary
+
+from transitions import Machine
+from transitions.core import listify
+from transitions.extensions import GraphMachine
+
+from machine_model.compiled import effective_callbacks
+
+
+# ==== CONSTANTS ====
+# Machines with more states than this are built lightweight unless asked otherwise
+LIGHTWEIGHT_MIN_STATES = 200
+
+# Drawing copies of lightweight machines, shared by the models of a machine
+_graph_machines = WeakKeyDictionary()
+
+
+def use_lightweight(states, lightweight=None):
+    """Resolve the construction mode, choosing it from the state count if unset."""
+    if lightweight is None:
+        return len(states) > LIGHTWEIGHT_MIN_STATES
+    return lightweight
+
+
+def create_state_machine(model, states, initial_state, lightweight=False):
+    """
+    Create the transitions machine backing a model.
+
+    The full mode is a GraphMachine with a to_<state> auto transition from
+    every state, which costs O(N²) events and bound methods. The
+    lightweight mode is a plain Machine without auto transitions; its graph
+    is only built when machine_graph asks for it.
+    """
+    if lightweight:
+        return Machine(model=model, states=states, initial=initial_state,
+                       auto_transitions=False)
+    return GraphMachine(model=model, states=states, initial=initial_state,
+                        auto_transitions=True, show_conditions=True)
+
+
+def add_transitions(machine, model, transitions):
+    """
+    Register the JSON transitions of a model in bulk.
+
+    Transitions are grouped by trigger, so each event is created and bound
+    to the model once, and each transition is appended to its event
+    without going through add_transition, which a GraphMachine follows
+    with a full graph regeneration. A list source gets one transition per
+    state and a dest of None an internal transition, as add_transition
+    would give them. Callback names are resolved on the model once; the
+    graph is regenerated once at the end.
+    """
+    resolve = _callback_resolver(model)
+    by_trigger = {}
+    for transition in transitions:
+        by_trigger.setdefault(transition["trigger"], []).append(transition)
+
+    create_transition = machine._create_transition
+    for trigger, trigger_transitions in by_trigger.items():
+        if trigger not in machine.events:
+            # Also checks the trigger name and binds it to the models
+            Machine.add_transition(machine, trigger, [], None)
+        event_transitions = machine.events[trigger].transitions
+
+        for transition in trigger_transitions:
+            source, dest = transition["source"], transition["dest"]
+            kwargs = _transition_kwargs(transition, resolve)
+            if source == machine.wildcard_all or dest == machine.wildcard_same:
+                Machine.add_transition(machine, trigger, source, dest, **kwargs)
+            else:
+                for state in listify(source):
+                    event_transitions[state].append(create_transition(state, dest, **kwargs))
+
+    _regenerate_graphs(machine)
+
+
+def add_compiled_transitions(machine, compiled):
+    """
+    Register the edges of a CompiledMachine on a machine.
+
+    Events are created in the compiled trigger order, the order
+    add_transitions creates them in, and every edge is appended to its
+    event as a Transition; the wildcards were expanded when compiling.
+    Callbacks are kept as names, which transitions resolves on the model
+    that fires them, so the machine can be shared with attach_model.
+    """
+    events = [None] * len(compiled.triggers)
+    for trigger in set(compiled.edge_triggers):
+        events[trigger] = compiled.triggers[trigger]
+    for trigger, name in enumerate(events):
+        if name is not None:
+            if name not in machine.events:
+                Machine.add_transition(machine, name, [], None)
+            events[trigger] = machine.events[name].transitions
+
+    states, callbacks, internal = compiled.states, compiled.callbacks, compiled.internal
+    create_transition = machine._create_transition
+    for source, trigger, dest, position in compiled.edges():
+        transition = callbacks.get(position)
+        kwargs = _transition_kwargs(transition, str) if transition else {}
+        events[trigger][states[source]].append(create_transition(
+            states[source], None if position in internal else states[dest], **kwargs))
+
+    _regenerate_graphs(machine)
+
+
+def attach_model(machine, model, initial_state):
+    """
+    Add a model to a machine built for an identical definition.
+
+    The model gets its own state, triggers and, on a GraphMachine, graph;
+    the states, events and transitions stay shared.
+    """
+    machine.add_model(model, initial=initial_state)
+
+
+def _callback_resolver(model):
+    """Return a function resolving callback names on a model, each once."""
+    resolved = {}
+
+    def resolve(name):
+        callback = resolved.get(name)
+        if callback is None:
+            callback = resolved[name] = getattr(model, name)
+        return callback
+
+    return resolve
+
+
+def _transition_kwargs(transition, resolve):
+    """
+    Return the add_transition keyword arguments of a JSON transition.
+
+    As before, only the first of before, after and conditions declared on
+    a transition is used.
+    """
+    for key, value in effective_callbacks(transition).items():
+        if key == "conditions":
+            return {"conditions": [value] if isinstance(value, str) else value}
+        return {key: resolve(value)}
+    return {}
+
+
+def _regenerate_graphs(machine):
+    if isinstance(machine, GraphMachine):
+        for graph_model in machine.models:
+            graph_model.get_graph(force_new=True)
+
+
+def set_model_state(model, state):
+    """
+    Move a model to a state.
+
+    Full machines go through the state's to_<state> trigger; lightweight
+    machines have none and assign the state directly.
+    """
+    goto_state = f"to_{state}"
+    if hasattr(model, goto_state):
+        getattr(model, goto_state)()
+    elif state in model.machine.states:
+        model.machine.set_state(state, model=model)
+
+
+def machine_graph(model):
+    """
+    Return the graph of a model's machine, highlighting its current state.
+
+    A lightweight machine gets a GraphMachine copy of its states and
+    transitions on the first call, kept for later calls of every model
+    sharing the machine.
+    """
+    machine = model.machine
+    if isinstance(machine, GraphMachine):
+        return model.get_graph()
+
+    graph_machine = _graph_machines.get(machine)
+    if graph_machine is None:
+        graph_machine = _graph_machines[machine] = create_graph_machine(
+            machine.states, model.state,
+            ((trigger, transition.source, transition.dest,
+              [condition.func for condition in transition.conditions if condition.target],
+              [condition.func for condition in transition.conditions if not condition.target])
+             for trigger, event in machine.events.items()
+             for transitions in event.transitions.values()
+             for transition in transitions))
+
+    graph_machine.set_state(model.state)
+    return graph_machine.get_graph(force_new=True)
+
+
+def create_graph_machine(states, initial_state, transitions):
+    """
+    Create a GraphMachine used only to draw a machine.
+
+    :param states: State names.
+    :param initial_state: State to highlight.
+    :param transitions: Iterable of (trigger, source, dest, conditions,
+        unless) tuples; conditions are only shown, never called.
+    """
+    graph_machine = GraphMachine(states=list(states), initial=initial_state,
+                                 auto_transitions=False, show_conditions=True)
+    for trigger, source, dest, conditions, unless in transitions:
+        graph_machine.add_transition(trigger, source, dest,
+                                     conditions=conditions, unless=unless)
+    return graph_machine
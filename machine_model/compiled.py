@@ -0,0 +1,271 @@
+"""
+Library-independent compiled form of a machine definition.
+
+A CompiledMachine holds what the engines need to run a machine: states
+and triggers as integer ids, the transitions as a CSR edge table and the
+callback of the transitions that declare before, after or conditions,
+by name. The outgoing transitions of state s sit at
+[offsets[s], offsets[s + 1]) of the edge arrays, sorted by trigger id
+and otherwise in declaration order. Internal transitions, declared with
+no dest, point back at their source and are listed by edge position, so
+engines stay in the state and transitions can rebuild them as internal.
+
+It holds no bound methods or library objects, so it pickles cheaply for
+snapshots and process pools, and one instance can back several machines.
+Its fingerprint identifies the definition regardless of the machine name
+and of the order states and triggers are listed in, so identical
+definitions saved under different names can share one instance.
+"""
+
+import hashlib
+import json
+from array import array
+from itertools import chain
+
+from machine_source.machine_format import (BINARY_EXTENSION, load_machine_file, read_machine,
+                                           read_machine_arrays)
+
+# ==== CONSTANTS ====
+WILDCARD_SOURCE = "*"
+SAME_DEST = "="
+# In precedence order; a transition only runs the first one it declares
+CALLBACK_KEYS = ("before", "after", "conditions")
+TRANSITION_KEYS = ("trigger", "source", "dest")
+
+
+class DefinitionError(ValueError):
+    """Raised when a machine definition cannot be compiled."""
+
+
+class CompiledMachine(object):
+
+    # Snapshots pickled before internal transitions compiled have none
+    internal = frozenset()
+
+    def __init__(self, machine_type, name, initial_state, states, triggers, offsets,
+                 edge_triggers, edge_dests, callbacks=None, functions=None, internal=None):
+        """
+        :param machine_type: Top-level key of the definition, e.g. WebActivityMachine.
+        :param name: Machine name.
+        :param initial_state: Name of the initial state.
+        :param states: State names; state ids index into it.
+        :param triggers: Trigger names in the order transitions would
+            register their events; trigger ids index into it.
+        :param offsets: CSR offsets, one per state plus one.
+        :param edge_triggers: Trigger id of every edge.
+        :param edge_dests: Destination state id of every edge.
+        :param callbacks: Dict of edge position to the before, after and
+            conditions names of the edges that declare any.
+        :param functions: Machine functions of the definition.
+        :param internal: Edge positions of the internal transitions.
+        """
+        self.machine_type = machine_type
+        self.name = name
+        self.initial_state = initial_state
+        self.states = states
+        self.triggers = triggers
+        self.offsets = offsets
+        self.edge_triggers = edge_triggers
+        self.edge_dests = edge_dests
+        self.callbacks = callbacks or {}
+        self.functions = functions or {}
+        self.internal = frozenset(internal or ())
+        self.fingerprint = self._fingerprint()
+        self._ids = None
+
+    def _fingerprint(self):
+        """
+        Hash the canonical form of the definition.
+
+        States are taken by name in sorted order, and the transitions of
+        each state by trigger name, keeping the declaration order of
+        transitions sharing a trigger, which decides which one fires.
+        """
+        states, triggers, callbacks = self.states, self.triggers, self.callbacks
+        offsets, edge_triggers, edge_dests = self.offsets, self.edge_triggers, self.edge_dests
+        internal = self.internal
+        sha = hashlib.sha256()
+        sha.update(json.dumps([self.machine_type, self.initial_state, sorted(states),
+                               self.functions], sort_keys=True, default=str).encode("utf-8"))
+        for source in sorted(range(len(states)), key=states.__getitem__):
+            edges = [(triggers[edge_triggers[position]],
+                      None if position in internal else states[edge_dests[position]],
+                      sorted(callbacks[position].items()) if position in callbacks else None)
+                     for position in range(offsets[source], offsets[source + 1])]
+            edges.sort(key=lambda edge: edge[0])
+            sha.update(repr((states[source], edges)).encode("utf-8"))
+        return sha.hexdigest()
+
+    def ids(self):
+        """Return the state and trigger id lookups, built once and shared by every machine."""
+        if self._ids is None:
+            self._ids = ({state: idx for idx, state in enumerate(self.states)},
+                         {trigger: idx for idx, trigger in enumerate(self.triggers)})
+        return self._ids
+
+    @classmethod
+    def from_edges(cls, machine_type, name, initial_state, states, triggers, sources, dests,
+                   edge_triggers, callbacks=None, functions=None, internal=None):
+        """
+        Compile transitions given as id arrays in declaration order.
+
+        :param callbacks: Dict of transition index to its callback names.
+        :param internal: Indexes of the internal transitions, whose dest is
+            their source.
+        """
+        callbacks = callbacks or {}
+        internal = internal or ()
+        trigger_count = max(len(triggers), 1)
+        # Stable, so transitions sharing a source and trigger keep their order
+        order = sorted(range(len(sources)),
+                       key=lambda idx: sources[idx] * trigger_count + edge_triggers[idx])
+
+        offsets = array("I", bytes(4 * (len(states) + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for idx in range(len(states)):
+            offsets[idx + 1] += offsets[idx]
+
+        return cls(machine_type, name, initial_state, list(states), list(triggers), offsets,
+                   array("I", (edge_triggers[idx] for idx in order)),
+                   array("I", (dests[idx] for idx in order)),
+                   {position: callbacks[idx] for position, idx in enumerate(order)
+                    if idx in callbacks},
+                   functions,
+                   [position for position, idx in enumerate(order) if idx in internal])
+
+    @classmethod
+    def from_config(cls, machine_type, config):
+        """
+        Compile a machine config as found in the JSON files.
+
+        An initial state missing from the states is added to them, as
+        transitions does; the processor writes "unknown" for empty machines.
+        A source may be a list of states, compiled to one edge per state,
+        and a dest of None declares an internal transition.
+
+        :raises DefinitionError: If there is no initial state, a transition
+            refers to an unknown state, or a transition misses a key.
+        """
+        if config.get("initial_state") is None:
+            raise DefinitionError("No initial state")
+        states = _with_state(config.get("states") or [], config["initial_state"])
+        state_ids = {state: idx for idx, state in enumerate(states)}
+        trigger_ids = {}
+        sources, dests, triggers = array("I"), array("I"), array("I")
+        callbacks = {}
+        internal = set()
+
+        for idx, transition in enumerate(config.get("transitions") or []):
+            missing = [key for key in TRANSITION_KEYS if key not in transition]
+            if missing:
+                raise DefinitionError(f"Transition {idx} has no {', '.join(missing)}")
+            source, dest = transition["source"], transition["dest"]
+            if source == WILDCARD_SOURCE:
+                source_ids = range(len(states))
+            else:
+                source_ids = [_state_id(state_ids, state, idx) for state in _listify(source)]
+            dest_id = None if dest in (None, SAME_DEST) else _state_id(state_ids, dest, idx)
+
+            trigger = trigger_ids.setdefault(transition["trigger"], len(trigger_ids))
+            declared = effective_callbacks(transition)
+            for source_id in source_ids:
+                if declared:
+                    callbacks[len(sources)] = declared
+                if dest is None:
+                    internal.add(len(sources))
+                sources.append(source_id)
+                dests.append(source_id if dest_id is None else dest_id)
+                triggers.append(trigger)
+
+        # Interned by first transition, the order transitions registers events in
+        for trigger in config.get("triggers") or []:
+            trigger_ids.setdefault(trigger, len(trigger_ids))
+        return cls.from_edges(machine_type, config.get("name"), config.get("initial_state"),
+                              states, list(trigger_ids), sources, dests, triggers, callbacks,
+                              config.get("functions"), internal)
+
+    @classmethod
+    def from_binary(cls, path):
+        """Compile a binary machine straight from its id arrays."""
+        header, strings, trigger_ids, sources, dests, triggers = read_machine_arrays(path)
+        state_count = header["states"]
+        if max(sources, default=-1) >= state_count or max(dests, default=-1) >= state_count:
+            return cls.from_config(header["type"], read_machine(path)[header["type"]][0])  # Wildcards
+
+        # Trigger ids of the file index into its string table
+        trigger_index = {}
+        for string_id in chain(triggers, trigger_ids):
+            trigger_index.setdefault(string_id, len(trigger_index))
+        trigger_names = [strings[string_id] for string_id in trigger_index]
+        edge_triggers = array("I", (trigger_index[string_id] for string_id in triggers))
+
+        callbacks = {}
+        for idx, extra in header["extras"].items():
+            declared = effective_callbacks(extra)
+            if declared:
+                callbacks[int(idx)] = declared
+        return cls.from_edges(header["type"], header["name"], header["initial_state"],
+                              _with_state(strings[:state_count], header["initial_state"]),
+                              trigger_names, sources, dests, edge_triggers,
+                              callbacks, header["functions"])
+
+    def edges(self):
+        """Yield (source, trigger, dest, position) ids of every edge in CSR order."""
+        offsets, edge_triggers, edge_dests = self.offsets, self.edge_triggers, self.edge_dests
+        for source in range(len(self.states)):
+            for position in range(offsets[source], offsets[source + 1]):
+                yield source, edge_triggers[position], edge_dests[position], position
+
+
+def effective_callbacks(transition):
+    """
+    Return the callback a transition runs with, as a dict of at most one key.
+
+    Only the first of before, after and conditions declared on a transition
+    is used, so every engine runs the same callback.
+    """
+    for key in CALLBACK_KEYS:
+        if transition.get(key):
+            return {key: transition[key]}
+    return {}
+
+
+def _listify(source):
+    """Return the states of a transition source, a state name or a list of them."""
+    return list(source) if isinstance(source, (list, tuple)) else [source]
+
+
+def _state_id(state_ids, state, idx):
+    """Return the id of a state transition idx refers to."""
+    try:
+        return state_ids[state]
+    except (KeyError, TypeError):
+        raise DefinitionError(f"Transition {idx} refers to unknown state {state!r}") from None
+
+
+def _with_state(states, state):
+    """Return a list of the states, with state appended if it is not among them."""
+    states = list(states)
+    if state not in states:
+        states.append(state)
+    return states
+
+
+def compile_machine_file(path, machine_type=None, index=0):
+    """
+    Compile a machine of a JSON or binary machine file.
+
+    Binary files are read through their id arrays without building
+    transition dicts.
+
+    :param path: Path of the JSON or binary machine.
+    :param machine_type: Top-level key of the definition; defaults to the first.
+    :param index: Position of the machine in its type's list.
+    """
+    if path.endswith(BINARY_EXTENSION):
+        return CompiledMachine.from_binary(path)
+
+    data = load_machine_file(path)
+    machine_type = machine_type or next(iter(data))
+    return CompiledMachine.from_config(machine_type, data[machine_type][index])
@@ -1,58 +1,267 @@
-import os
 import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from weakref import WeakValueDictionary
 from machine_model.narcoleptic_superhero import NarcolepticSuperhero
 from machine_model.base import Base
+from machine_model.builder import add_compiled_transitions, use_lightweight
+from machine_model.compiled import compile_machine_file
+from machine_model.native import NativeMachine
+from machine_source.cache import (index_snapshots, load_snapshot, snapshot_fingerprint, snapshot_key,
+                                  store_snapshot, write_snapshot)
+from machine_source.manifest import SOURCE_DIR, refresh_manifest
+
+# ==== CONSTANTS ====
+# Entries handed to each worker process in this many chunks, to balance large machines
+CHUNKS_PER_WORKER = 4
+
+# Compiled machines and transitions machines by definition fingerprint,
+# shared by every entry of an identical definition while one is in use
+_compiled_machines = WeakValueDictionary()
+_state_machines = WeakValueDictionary()
+
+
+class MachineEntry(object):
+    """
+    Catalog entry of one machine definition, built on first use.
+
+    Listing a machine only needs its name, type, initial state and counts;
+    the definition is loaded and the machine built when load() is first
+    called, and the built machine is reused afterwards.
+    """
+
+    def __init__(self, path, machine_type, index, name, initial_state,
+                 state_count, transition_count, digest=None):
+        self.path = path
+        self.machine_type = machine_type
+        self.index = index
+        self.name = name
+        self.initial_state = initial_state
+        self.state_count = state_count
+        self.transition_count = transition_count
+        self.digest = digest
+        self._machine = None
+
+    @property
+    def state(self):
+        """Current state of the built machine, or the initial state."""
+        if self._machine is None:
+            return self.initial_state
+        return self._machine.state
+
+    def load(self, native=False, errors=None):
+        """
+        Build the machine, or return the one built before.
+
+        :param native: Build a NativeMachine instead of a transitions model,
+            for every machine type but NarcolepticSuperheroes, whose
+            callbacks live on its class.
+        :param errors: Dict the error message is added to, by path, when
+            the machine cannot be built; when None it is printed instead.
+        :return: The machine, or None if it cannot be built.
+        """
+        if self._machine is None:
+            report = {} if errors is None else errors
+            try:
+                self.bind(self.compile(), native)
+            except Exception as e:
+                _add_error(report, self, _error_message(e))
+            if errors is None:
+                print_build_errors(report)
+        return self._machine
+
+    def bind(self, compiled, native=False):
+        """Build the machine of the entry from its compiled form, as load does."""
+        if native and self.machine_type != "NarcolepticSuperheroes":
+            self._machine = NativeMachine(compiled, self.name)
+        else:
+            self._machine = MachineFactory.create_compiled_machine(compiled, name=self.name)
+        return self._machine
+
+    def snapshot_key(self):
+        """Return the key of the machine's snapshot, or None without a source digest."""
+        if not self.digest:
+            return None
+        return snapshot_key(self.digest, self.machine_type, self.index)
+
+    def compile(self, index=True):
+        """
+        Return the compiled form of the machine.
+
+        An identical definition compiled before is reused; otherwise it
+        is read from the snapshot kept for the digest of the source file
+        when there is one, and compiled and snapshotted if not.
+
+        :param index: Record a new snapshot in the snapshot index; pool
+            workers leave that to the parent, which records them at once.
+        """
+        key = self.snapshot_key()
+        fingerprint = snapshot_fingerprint(key) if key else None
+        compiled = None
+        if fingerprint:
+            compiled = _compiled_machines.get(fingerprint) or load_snapshot(fingerprint)
+        if compiled is None:
+            compiled = compile_machine_file(self.path, self.machine_type, self.index)
+            if key and index:
+                store_snapshot(key, compiled)
+            elif key:
+                write_snapshot(compiled)
+        return share_compiled(compiled)
 
 
 class MachineFactory:
 
     @staticmethod
-    def build_machines():
-        machines = []
-        machine_sources = MachineFactory.get_source()
-
-        for config_data in machine_sources:
-            for machine_type, machines_config in config_data.items():
-                if isinstance(machines_config, list):
-                    for machine_config in machines_config:
-                        name = machine_config.get("name")
-                        initial_state = machine_config.get("initial_state")
-                        states = machine_config.get("states")
-                        transitions = machine_config.get("transitions")
-                        functions = machine_config.get("functions")
-                        triggers = machine_config.get("triggers")
-
-                        machine = MachineFactory.create_machine(
-                            machine_type, name, initial_state, states, transitions, functions, triggers)
-                        if machine:
-                            machines.append(machine)
-
-        return machines
+    def build_machines(lazy=True, workers=None, native=False, errors=None):
+        """
+        List the machines under 'machine_source'.
+
+        :param lazy: Return MachineEntry catalog entries, which build their
+            machine when selected unless workers is given; otherwise
+            return the built machines.
+        :param workers: Build every machine now, compiling them on a pool
+            of this many processes and binding them to their models here.
+        :param native: Bind the machines built now to NativeMachine, as
+            MachineEntry.load does.
+        :param errors: Dict filled with the error messages of every file
+            that could not be read or built, by path, in catalog order;
+            when None they are printed instead.
+        """
+        report = {} if errors is None else errors
+        entries = MachineFactory.catalog(report)
+        if workers or not lazy:
+            compiled_machines = MachineFactory.compile_entries(entries, workers, report)
+            entries = [entry for entry, compiled in zip(entries, compiled_machines)
+                       if compiled is not None]
+            for entry, compiled in zip(entries, filter(None, compiled_machines)):
+                entry.bind(compiled, native)
+
+        if errors is None:
+            print_build_errors(report)
+        if lazy:
+            return entries
+        return [entry.load() for entry in entries]
+
+    @staticmethod
+    def compile_entries(entries, workers=None, errors=None):
+        """
+        Compile catalog entries, on a process pool if workers is given.
+
+        Parsing, validating and compiling run in the workers; the compiled
+        machines come back in the order of the entries.
+
+        :param errors: Dict the error messages are added to, by path.
+        :return: List of CompiledMachine, with None for failed entries.
+        """
+        if workers and len(entries) > 1:
+            chunksize = max(1, len(entries) // (workers * CHUNKS_PER_WORKER))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_compile_entry, entries, repeat(False),
+                                            chunksize=chunksize))
+            # Indexed here in one write, as the workers would overwrite each other's keys
+            index_snapshots({entry.snapshot_key(): compiled.fingerprint
+                             for entry, (compiled, _) in zip(entries, results)
+                             if compiled is not None and entry.snapshot_key()})
+        else:
+            results = [_compile_entry(entry) for entry in entries]
+
+        compiled_machines = []
+        for entry, (compiled, error) in zip(entries, results):
+            if error is not None and errors is not None:
+                _add_error(errors, entry, error)
+            compiled_machines.append(compiled and share_compiled(compiled))
+        return compiled_machines
 
     @staticmethod
-    def get_source():
-        json_data_list = []
-
-        # Walk through 'machine_source' and its subdirectories
-        for root, _, files in os.walk('machine_source'):
-            for filename in files:
-                if filename.endswith('.json'):
-                    file_path = os.path.join(root, filename)
-
-                    with open(file_path, 'r', encoding="utf-8") as file:
-                        try:
-                            config_data = json.load(file)
-                            json_data_list.append(config_data)
-                        except json.JSONDecodeError:
-                            print(f"Error decoding JSON file: {file_path}")
-                        except Exception as e:
-                            print(f"Error reading file {file_path}: {e}")
-
-        return json_data_list
+    def catalog(errors=None):
+        """
+        Return the catalog entries of every machine definition file.
+
+        Entries come from the machine_source manifest, which only reads
+        the files added or changed since it was last saved.
+
+        :param errors: Dict the error messages of unreadable files are
+            added to, by path.
+        """
+        entries = []
+        for file_path, record in refresh_manifest(SOURCE_DIR):
+            if record.get("error") and errors is not None:
+                errors.setdefault(file_path, []).append(record["error"])
+            for summary in record["machines"]:
+                entries.append(MachineEntry(
+                    file_path, summary["type"], summary["index"], summary["name"],
+                    summary["initial_state"], summary["states"], summary["transitions"],
+                    record["hash"]))
+        return entries
 
     @staticmethod
-    def create_machine(machine_type, name, initial_state, states, transitions, functions, triggers):
+    def create_machine(machine_type, name, initial_state, states, transitions, functions, triggers,
+                       lightweight=None, machine=None):
+        """
+        Build the model of a machine definition.
+
+        :param lightweight: Build a plain Machine without auto transitions
+            instead of a GraphMachine; by default only machines with more
+            than LIGHTWEIGHT_MIN_STATES states are.
+        :param machine: Machine of an identical definition to add the model
+            to, instead of building one from transitions.
+        """
         if machine_type == "NarcolepticSuperheroes":
-            return NarcolepticSuperhero(name, states, transitions, functions, initial_state)
+            return NarcolepticSuperhero(name, states, transitions, functions, initial_state,
+                                        lightweight, machine)
+
+        return Base(name, states, transitions, functions, initial_state, lightweight, machine)
+
+    @staticmethod
+    def create_compiled_machine(compiled, lightweight=None, name=None):
+        """
+        Build the model of a CompiledMachine.
+
+        The first model of a definition is created without transitions and
+        its edges are then registered straight from the compiled edge
+        table; later models of identical definitions are added to the same
+        machine, and only get their own state, triggers and graph.
+
+        :param name: Model name; defaults to the compiled one.
+        """
+        lightweight = use_lightweight(compiled.states, lightweight)
+        shared_key = (compiled.fingerprint, lightweight)
+        machine = _state_machines.get(shared_key)
+        model = MachineFactory.create_machine(
+            compiled.machine_type, name or compiled.name, compiled.initial_state, compiled.states,
+            [], compiled.functions, compiled.triggers, lightweight, machine)
+        if machine is None:
+            add_compiled_transitions(model.machine, compiled)
+            _state_machines[shared_key] = model.machine
+        return model
+
+
+def _compile_entry(entry, index=True):
+    """Compile one catalog entry; return (compiled, None) or (None, error message)."""
+    try:
+        return entry.compile(index), None
+    except Exception as e:
+        return None, _error_message(e)
+
+
+def _error_message(error):
+    if isinstance(error, json.JSONDecodeError):
+        return f"Error decoding JSON file: {error}"
+    return f"{error.__class__.__name__}: {error}"
+
+
+def _add_error(errors, entry, message):
+    errors.setdefault(entry.path, []).append(f"{entry.name}: {message}")
+
+
+def share_compiled(compiled):
+    """Return the compiled machine in use for the fingerprint of compiled, registering it if none is."""
+    return _compiled_machines.setdefault(compiled.fingerprint, compiled)
+
 
-        return Base(name, states, transitions, functions, initial_state)
+def print_build_errors(errors):
+    """Print build errors as returned by build_machines, one block per file."""
+    for file_path, messages in errors.items():
+        print(f"Could not build machines from {file_path}:")
+        for message in messages:
+            print(f"- {message}")
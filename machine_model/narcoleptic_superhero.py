@@ -1,39 +1,24 @@
 import random
-from transitions import Machine
-from transitions.extensions import GraphMachine
+from machine_model.builder import (add_transitions, attach_model, create_state_machine,
+                                   machine_graph, set_model_state, use_lightweight)
 
 
 class NarcolepticSuperhero(object):
 
-    def __init__(self, name, states, transitions, functions, initial_state):
+    def __init__(self, name, states, transitions, functions, initial_state, lightweight=None,
+                 machine=None):
         self.name = name
         self.states = states
         self.initial_state = initial_state
         self.kittens_rescued = 0
-        self.machine = GraphMachine(model=self, states=states,
-                                    initial=initial_state, auto_transitions=True, show_conditions=True)
-
-        for transition in transitions:
-            trigger = transition["trigger"]
-            source = transition["source"]
-            dest = transition["dest"]
-            before = transition.get("before")
-            after = transition.get("after")
-            conditions = transition.get("conditions")
-
-            if before:
-                self.machine.add_transition(
-                    trigger, source, dest, before=getattr(self, before))
-            elif after:
-                self.machine.add_transition(
-                    trigger, source, dest, after=getattr(self, after))
-            elif conditions:
-                if isinstance(conditions, str):
-                    conditions = [conditions]
-                self.machine.add_transition(
-                    trigger, source, dest, conditions=conditions)
-            else:
-                self.machine.add_transition(trigger, source, dest)
+        self.lightweight = use_lightweight(states, lightweight)
+        if machine is not None:
+            # Shared with the models of identical definitions
+            self.machine = machine
+            attach_model(machine, self, initial_state)
+        else:
+            self.machine = create_state_machine(self, states, initial_state, self.lightweight)
+            add_transitions(self.machine, self, transitions)
 
         for func_name, func in functions.items():
             if callable(func):
@@ -61,7 +46,7 @@ class NarcolepticSuperhero(object):
         print("")
 
     def set_state(self, state):
-        goto_state = f"to_{state}"
-        if hasattr(self, goto_state):
-            set = getattr(self, goto_state)
-            set()
+        set_model_state(self, state)
+
+    def graph(self):
+        return machine_graph(self)
@@ -0,0 +1,182 @@
+"""
+Array-backed machine engine.
+
+NativeMachine runs the machine definitions of machine_source without the
+transitions library. It runs the CSR edge table of a CompiledMachine,
+whose outgoing transitions of a state are sorted by trigger id, so firing
+a trigger is one bisect over the current state's edges.
+
+Callbacks are only looked up for the transitions that declare before,
+after or conditions; a machine without any fires triggers without
+touching them. It offers the parts of Base the simulations use (name,
+states, initial_state, state, trigger, set_state, show_states, graph and
+machine.get_triggers), so it can stand in for Base there.
+"""
+
+from bisect import bisect_left
+from weakref import WeakKeyDictionary
+
+from machine_model.builder import create_graph_machine
+from machine_model.compiled import CompiledMachine, compile_machine_file
+
+
+# Drawing copies, shared by the machines running one CompiledMachine
+_graph_machines = WeakKeyDictionary()
+
+
+class MachineError(Exception):
+    """Raised when a trigger cannot fire from the current state."""
+
+
+class NativeMachine(object):
+
+    def __init__(self, compiled, name=None):
+        """
+        :param compiled: CompiledMachine to run; its arrays are shared,
+            not copied, so several machines can run one definition.
+        :param name: Machine name; defaults to the compiled one.
+        """
+        self.compiled = compiled
+        self.name = name or compiled.name
+        self.states = compiled.states
+        self.initial_state = compiled.initial_state
+        self.machine = self
+        self.state_ids, self.trigger_ids = compiled.ids()
+        self.triggers = compiled.triggers
+
+        for func_name, func in compiled.functions.items():
+            if callable(func):
+                setattr(self, func_name, func)
+
+        self._offsets = compiled.offsets
+        self._edge_triggers = compiled.edge_triggers
+        self._edge_dests = compiled.edge_dests
+        self._callbacks = {position: self._bind_callbacks(transition)
+                           for position, transition in compiled.callbacks.items()}
+        self._state = self.state_ids[self.initial_state]
+
+    def _bind_callbacks(self, transition):
+        """Resolve the callback names of a transition once."""
+        conditions = transition.get("conditions") or []
+        if isinstance(conditions, str):
+            conditions = [conditions]
+        return ([getattr(self, name) for name in _names(transition.get("before"))],
+                [getattr(self, name) for name in _names(transition.get("after"))],
+                conditions)
+
+    def _conditions_hold(self, conditions):
+        for name in conditions:
+            value = getattr(self, name)
+            if not (value() if callable(value) else value):
+                return False
+        return True
+
+    @classmethod
+    def from_config(cls, config, machine_type=None):
+        """Build a machine from a config as found in the JSON files."""
+        return cls(CompiledMachine.from_config(machine_type, config))
+
+    @classmethod
+    def from_binary(cls, path):
+        """Build a machine straight from the id arrays of a binary machine."""
+        return cls(CompiledMachine.from_binary(path))
+
+    @property
+    def state(self):
+        return self.states[self._state]
+
+    def get_triggers(self, state):
+        """Return the triggers that can fire from a state, in declaration order."""
+        state_id = self.state_ids[state]
+        edge_triggers = self._edge_triggers
+        triggers = dict.fromkeys(
+            edge_triggers[idx] for idx in range(self._offsets[state_id], self._offsets[state_id + 1]))
+        return [self.triggers[trigger] for trigger in triggers]
+
+    def trigger(self, trigger_name):
+        """
+        Fire a trigger from the current state.
+
+        :return: True if a transition fired, False if every transition of
+            the trigger was blocked by its conditions.
+        :raises MachineError: If the trigger has no transition from the
+            current state.
+        """
+        trigger = self.trigger_ids.get(trigger_name)
+        if trigger is not None:
+            edge_triggers = self._edge_triggers
+            end = self._offsets[self._state + 1]
+            idx = bisect_left(edge_triggers, trigger, self._offsets[self._state], end)
+            if idx < end and edge_triggers[idx] == trigger:
+                if not self._callbacks:
+                    self._state = self._edge_dests[idx]
+                    return True
+                return self._fire(trigger, idx, end)
+
+        raise MachineError(f"Can't trigger event {trigger_name} from state {self.state}!")
+
+    def _fire(self, trigger, idx, end):
+        """Fire the first transition of a trigger whose conditions hold."""
+        edge_triggers = self._edge_triggers
+        while idx < end and edge_triggers[idx] == trigger:
+            callbacks = self._callbacks.get(idx)
+            if callbacks is None:
+                self._state = self._edge_dests[idx]
+                return True
+
+            before, after, conditions = callbacks
+            if self._conditions_hold(conditions):
+                for callback in before:
+                    callback()
+                self._state = self._edge_dests[idx]
+                for callback in after:
+                    callback()
+                return True
+            idx += 1
+        return False
+
+    def set_state(self, state):
+        state_id = self.state_ids.get(state)
+        if state_id is not None:
+            self._state = state_id
+
+    def show_states(self):
+        print(f"\nStates for {self.name}:")
+        for state in self.states:
+            print(f"- {state}")
+        print("")
+
+    def graph(self):
+        """Return the graph of the machine, highlighting the current state."""
+        graph_machine = _graph_machines.get(self.compiled)
+        if graph_machine is None:
+            graph_machine = _graph_machines[self.compiled] = create_graph_machine(
+                self.states, self.state, self._graph_transitions())
+        graph_machine.set_state(self.state)
+        return graph_machine.get_graph(force_new=True)
+
+    def _graph_transitions(self):
+        internal = self.compiled.internal
+        for source in range(len(self.states)):
+            for idx in range(self._offsets[source], self._offsets[source + 1]):
+                callbacks = self._callbacks.get(idx)
+                dest = None if idx in internal else self.states[self._edge_dests[idx]]
+                yield (self.triggers[self._edge_triggers[idx]], self.states[source],
+                       dest, callbacks[2] if callbacks else [], [])
+
+
+def _names(callbacks):
+    if not callbacks:
+        return []
+    return [callbacks] if isinstance(callbacks, str) else list(callbacks)
+
+
+def load_native_machine(path, machine_type=None, index=0):
+    """
+    Load a machine file into a NativeMachine.
+
+    :param path: Path of the JSON or binary machine.
+    :param machine_type: Top-level key of the definition; defaults to the first.
+    :param index: Position of the machine in its type's list.
+    """
+    return NativeMachine(compile_machine_file(path, machine_type, index))
@@ -8,7 +8,7 @@ def max_depth_path_simulation(machine, dest_state, max_depth):
         max_depth: The maximum depth of the search
     """
     import os
-    import json
+    from machine_source.machine_format import load_machine_file, machine_file
 
     all_paths = []
     debug_enabled = True  # Set to False to disable detailed debug output
@@ -27,50 +27,50 @@ def max_depth_path_simulation(machine, dest_state, max_depth):
     json_filename = f"{machine.name}.json"
     parts = machine.name.rsplit("_", 2)
     prefix = parts[0]
+    # Through the binary twin only if it is not older than the JSON
     json_paths = [
-        json_filename,
-        os.path.join("machine_source", prefix, json_filename),
+        machine_file(json_filename),
+        machine_file(os.path.join("machine_source", prefix, json_filename)),
     ]
 
     for json_path in json_paths:
         if os.path.exists(json_path):
             try:
-                with open(json_path, 'r') as f:
-                    print(f"Found and loading transitions from: {json_path}")
-                    data = json.load(f)
-
-                    # Look for a machine definition that matches our machine name
-                    for category, machines in data.items():
-                        if isinstance(machines, list):
-                            for machine_data in machines:
-                                if machine_data.get("name") == machine.name:
-                                    # Found the machine configuration!
-                                    print(
-                                        f"Found machine definition in category '{category}'")
-
-                                    # Extract transitions
-                                    for t in machine_data.get("transitions", []):
-                                        source = t.get("source")
-                                        trigger = t.get("trigger")
-                                        dest = t.get("dest")
-
-                                        # Skip wildcards
-                                        if source == "*":
-                                            continue
-
-                                        # Add this transition to our map
-                                        if source not in transitions_map:
-                                            transitions_map[source] = []
-
-                                        # Only add if it's not already there
-                                        if (trigger, dest) not in transitions_map[source]:
-                                            transitions_map[source].append(
-                                                (trigger, dest))
-
-                                    json_file_loaded = True
-                                    break
-                        if json_file_loaded:
-                            break
+                print(f"Found and loading transitions from: {json_path}")
+                data = load_machine_file(json_path)
+
+                # Look for a machine definition that matches our machine name
+                for category, machines in data.items():
+                    if isinstance(machines, list):
+                        for machine_data in machines:
+                            if machine_data.get("name") == machine.name:
+                                # Found the machine configuration!
+                                print(
+                                    f"Found machine definition in category '{category}'")
+
+                                # Extract transitions
+                                for t in machine_data.get("transitions", []):
+                                    source = t.get("source")
+                                    trigger = t.get("trigger")
+                                    dest = t.get("dest")
+
+                                    # Skip wildcards
+                                    if source == "*":
+                                        continue
+
+                                    # Add this transition to our map
+                                    if source not in transitions_map:
+                                        transitions_map[source] = []
+
+                                    # Only add if it's not already there
+                                    if (trigger, dest) not in transitions_map[source]:
+                                        transitions_map[source].append(
+                                            (trigger, dest))
+
+                                json_file_loaded = True
+                                break
+                    if json_file_loaded:
+                        break
                 if json_file_loaded:
                     break
             except Exception as e:
@@ -48,7 +48,7 @@ def run_path_simulation(machine):
 def run_graph_simulation(machine):
     directory = 'machine_graph'
     graph_path = os.path.join(directory, f'{machine.name}.png')
-    machine.machine.get_graph().draw(graph_path, prog='dot')
+    machine.graph().draw(graph_path, prog='dot')
 
     viewer = GraphSimulation(graph_path)
     viewer.mainloop()
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import pickle
+
+# ==== CONSTANTS ====
+CACHE_DIR = os.path.join("machine_source", ".cache")
+EXTRACT_CACHE_DIR = os.path.join(CACHE_DIR, "extract")
+MACHINE_CACHE_DIR = os.path.join(CACHE_DIR, "machines")
+SNAPSHOT_INDEX = os.path.join(MACHINE_CACHE_DIR, "index.pickle")
+DIGEST_INDEX = os.path.join(CACHE_DIR, "digests.pickle")
+CACHE_FORMAT = "1"
+# Bump when the pickled form of compiled machines changes
+SNAPSHOT_FORMAT = "3"
+HASH_BLOCK_SIZE = 1 << 20
+# Raised by pickles that are damaged or were written by another code layout
+PICKLE_ERRORS = (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError)
+
+
+def _load_pickle(path, default=None):
+    try:
+        with open(path, "rb") as file:
+            return pickle.load(file)
+    except PICKLE_ERRORS:
+        return default
+
+
+def _store_pickle(path, data):
+    """Write a pickle atomically, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's content."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def file_digest(path):
+    """
+    Return the SHA-256 hex digest of a file.
+
+    Digests are remembered by path, size and modification time, so an
+    unchanged file is not read again.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    index = _load_pickle(DIGEST_INDEX, {})
+    abs_path = os.path.abspath(path)
+
+    cached = index.get(abs_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    digest = hash_file(path)
+    index[abs_path] = (signature, digest)
+    _store_pickle(DIGEST_INDEX, index)
+    return digest
+
+
+def extractor_identity(extract_function):
+    """Return the module, name and version tag identifying an extractor."""
+    module = getattr(extract_function, "__module__", "")
+    name = getattr(extract_function, "__qualname__", repr(extract_function))
+    version = getattr(extract_function, "version", "0")
+    return f"{module}.{name}@{version}"
+
+
+def cache_key(input_path, extract_function):
+    """Return the cache key of an input file processed by an extractor."""
+    parts = (CACHE_FORMAT, file_digest(input_path),
+             extractor_identity(extract_function))
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_extraction(key):
+    """Return the cached extraction result for a key, or None on a miss."""
+    return _load_pickle(os.path.join(EXTRACT_CACHE_DIR, f"{key}.pickle"))
+
+
+def store_extraction(key, result):
+    """Cache an extraction result under a key."""
+    _store_pickle(os.path.join(EXTRACT_CACHE_DIR, f"{key}.pickle"), result)
+
+
+def snapshot_key(digest, machine_type, index):
+    """Return the snapshot key of a machine, given the digest of its source file."""
+    parts = (SNAPSHOT_FORMAT, digest, str(machine_type), str(index))
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def snapshot_fingerprint(key):
+    """Return the fingerprint of the machine snapshotted under a key, or None."""
+    return _load_pickle(SNAPSHOT_INDEX, {}).get(key)
+
+
+def load_snapshot(fingerprint):
+    """Return the compiled machine snapshot of a fingerprint, or None on a miss."""
+    return _load_pickle(os.path.join(MACHINE_CACHE_DIR, f"{fingerprint}.pickle"))
+
+
+def write_snapshot(compiled):
+    """Write the snapshot of a compiled machine, once per fingerprint."""
+    path = os.path.join(MACHINE_CACHE_DIR, f"{compiled.fingerprint}.pickle")
+    if not os.path.exists(path):
+        _store_pickle(path, compiled)
+
+
+def index_snapshots(fingerprints):
+    """
+    Record the fingerprints of snapshot keys in the snapshot index.
+
+    The index is read and written once, by a single process; pool
+    workers only write snapshots and leave their keys to the parent.
+
+    :param fingerprints: Dict of snapshot key to fingerprint.
+    """
+    index = _load_pickle(SNAPSHOT_INDEX, {})
+    missing = {key: fingerprint for key, fingerprint in fingerprints.items()
+               if index.get(key) != fingerprint}
+    if missing:
+        index.update(missing)
+        _store_pickle(SNAPSHOT_INDEX, index)
+
+
+def store_snapshot(key, compiled):
+    """
+    Cache a compiled machine under a key.
+
+    Snapshots are stored once per fingerprint; keys of identical
+    definitions only add an entry to the snapshot index.
+    """
+    write_snapshot(compiled)
+    index_snapshots({key: compiled.fingerprint})
+
+
+def clear_cache():
+    """Remove every cached extraction, machine snapshot and the digest index."""
+    for root, _, files in os.walk(CACHE_DIR, topdown=False):
+        for filename in files:
+            os.remove(os.path.join(root, filename))
+        os.rmdir(root)
@@ -0,0 +1,260 @@
+"""
+Compact binary machine format.
+
+A binary machine holds the same definition as a generated JSON machine:
+
+- a preamble with the magic bytes, format version and header length,
+- a small JSON header (type, name, initial state, counts, functions and
+  the callbacks of the few transitions that declare them),
+- a string table of NUL separated UTF-8 strings, states first,
+- the trigger ids and the (source, dest, trigger) edge arrays as
+  little-endian uint32 arrays.
+
+Files are read through mmap and the string table is split in one call,
+so loading cost is dominated by copying the integer arrays.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# ==== CONSTANTS ====
+MAGIC = b"FSMB"
+FORMAT_VERSION = 1
+BINARY_EXTENSION = ".fsmb"
+SEPARATOR = "\0"
+PREAMBLE = struct.Struct("<4sII")
+EDGE_KEYS = ("trigger", "source", "dest")
+
+
+def _pad(size):
+    return -size % 4
+
+
+def _uint32_bytes(values):
+    data = array("I", values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _uint32_array(buffer, start, count):
+    data = array("I")
+    data.frombytes(buffer[start:start + 4 * count])
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data
+
+
+def _machine_parts(machine_type, name, initial_state, strings, state_count, trigger_ids,
+                   sources, dests, triggers, functions=None, extras=None):
+    """Yield the encoded sections of a machine built from its id arrays."""
+    if any(SEPARATOR in string for string in strings):
+        raise ValueError("Machine strings may not contain NUL characters")
+    blob = SEPARATOR.join(strings).encode("utf-8")
+
+    header = json.dumps({
+        "type": machine_type,
+        "name": name,
+        "initial_state": initial_state,
+        "states": state_count,
+        "strings": len(strings),
+        "string_bytes": len(blob),
+        "triggers": len(trigger_ids),
+        "transitions": len(sources),
+        "functions": functions or {},
+        "extras": extras or {},
+    }).encode("utf-8")
+
+    yield PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header))
+    yield header
+    yield b"\0" * _pad(PREAMBLE.size + len(header))
+    yield blob
+    yield b"\0" * _pad(len(blob))
+    for values in (trigger_ids, sources, dests, triggers):
+        yield _uint32_bytes(values)
+
+
+def _config_arrays(config):
+    """Intern the strings of a machine config into the binary id arrays."""
+    strings = list(config.get("states") or [])
+    string_ids = {string: idx for idx, string in enumerate(strings)}
+
+    def intern(string):
+        string_id = string_ids.get(string)
+        if string_id is None:
+            string_id = string_ids[string] = len(strings)
+            strings.append(string)
+        return string_id
+
+    trigger_ids = [intern(trigger) for trigger in config.get("triggers") or []]
+    sources, dests, triggers = array("I"), array("I"), array("I")
+    extras = {}
+    for idx, transition in enumerate(config.get("transitions") or []):
+        triggers.append(intern(transition["trigger"]))
+        sources.append(intern(transition["source"]))
+        dests.append(intern(transition["dest"]))
+        extra = {key: value for key, value in transition.items()
+                 if key not in EDGE_KEYS}
+        if extra:
+            extras[str(idx)] = extra
+    return strings, trigger_ids, sources, dests, triggers, extras
+
+
+def _config_parts(machine_type, config):
+    strings, trigger_ids, sources, dests, triggers, extras = _config_arrays(config)
+    return _machine_parts(machine_type, config.get("name"), config.get("initial_state"),
+                          strings, len(config.get("states") or []), trigger_ids,
+                          sources, dests, triggers, config.get("functions"), extras)
+
+
+def encode_machine(machine_type, config):
+    """
+    Encode a machine definition to the binary format.
+
+    :param machine_type: Top-level key of the definition, e.g. WebActivityMachine.
+    :param config: Machine config with name, initial_state, states,
+        triggers, transitions and functions, as found in the JSON files.
+    :return: The encoded bytes.
+    """
+    return b"".join(_config_parts(machine_type, config))
+
+
+def write_machine(path, machine_type, config):
+    """Write a machine definition to a binary file."""
+    with open(path, "wb") as file:
+        file.writelines(_config_parts(machine_type, config))
+
+
+def write_machine_arrays(path, machine_type, name, initial_state, strings, state_count,
+                         trigger_ids, sources, dests, triggers):
+    """
+    Write a machine given as id arrays, without building a config first.
+
+    :param strings: String table, the states first.
+    :param state_count: Number of states at the start of strings.
+    :param trigger_ids: Ids of the machine triggers in strings.
+    :param sources: Source state id of every transition.
+    :param dests: Destination state id of every transition.
+    :param triggers: Trigger string id of every transition.
+    """
+    with open(path, "wb") as file:
+        file.writelines(_machine_parts(machine_type, name, initial_state, strings, state_count,
+                                       trigger_ids, sources, dests, triggers))
+
+
+def read_machine_header(path):
+    """Read only the JSON header of a binary machine, e.g. for listing it."""
+    with open(path, "rb") as file:
+        magic, version, header_size = PREAMBLE.unpack(file.read(PREAMBLE.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} binary machine")
+        return json.loads(file.read(header_size))
+
+
+def read_machine_arrays(path):
+    """
+    Read a binary machine without building transition dicts.
+
+    :return: Tuple of (header, strings, trigger_ids, sources, dests,
+        triggers); ids index into strings and states are
+        strings[:header["states"]].
+    """
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            magic, version, header_size = PREAMBLE.unpack_from(buffer, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} binary machine")
+
+            pos = PREAMBLE.size
+            header = json.loads(buffer[pos:pos + header_size])
+            pos += header_size + _pad(pos + header_size)
+
+            string_bytes = header["string_bytes"]
+            strings = []
+            if header["strings"]:
+                strings = buffer[pos:pos + string_bytes].decode(
+                    "utf-8").split(SEPARATOR)
+            pos += string_bytes + _pad(string_bytes)
+
+            trigger_ids = _uint32_array(buffer, pos, header["triggers"])
+            pos += 4 * header["triggers"]
+            count = header["transitions"]
+            sources = _uint32_array(buffer, pos, count)
+            dests = _uint32_array(buffer, pos + 4 * count, count)
+            triggers = _uint32_array(buffer, pos + 8 * count, count)
+
+    return header, strings, trigger_ids, sources, dests, triggers
+
+
+def read_machine(path):
+    """
+    Read a binary machine into the same structure as its JSON export.
+
+    :return: Dict mapping the machine type to a list with one config.
+    """
+    header, strings, trigger_ids, sources, dests, triggers = read_machine_arrays(path)
+
+    transitions = [{"trigger": strings[trigger], "source": strings[source], "dest": strings[dest]}
+                   for source, dest, trigger in zip(sources, dests, triggers)]
+    for idx, extra in header["extras"].items():
+        transitions[int(idx)].update(extra)
+
+    config = {
+        "name": header["name"],
+        "initial_state": header["initial_state"],
+        "states": strings[:header["states"]],
+        "triggers": [strings[trigger] for trigger in trigger_ids],
+        "transitions": transitions,
+        "functions": header["functions"],
+    }
+    return {header["type"]: [config]}
+
+
+def load_machine_file(path):
+    """Load a machine definition file, binary or JSON, by its extension."""
+    if path.endswith(BINARY_EXTENSION):
+        return read_machine(path)
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def binary_path(json_path):
+    """Return the binary path stored next to a JSON machine."""
+    return f"{os.path.splitext(json_path)[0]}{BINARY_EXTENSION}"
+
+
+def prefer_binary(json_stat, binary_stat):
+    """
+    Tell whether a JSON machine should be loaded through its binary twin.
+
+    The binary is used when it is at least as recent as the JSON, or when
+    there is no JSON; a JSON edited after its binary was written wins.
+
+    :param json_stat: os.stat result of the JSON, or None if it is missing.
+    :param binary_stat: os.stat result of the binary, or None if it is missing.
+    """
+    if binary_stat is None:
+        return False
+    return json_stat is None or binary_stat.st_mtime_ns >= json_stat.st_mtime_ns
+
+
+def machine_file(json_path):
+    """
+    Return the file to load a JSON machine from: its binary twin if
+    prefer_binary says so, the JSON path otherwise, which may not exist.
+    """
+    binary = binary_path(json_path)
+    if prefer_binary(_stat(json_path), _stat(binary)):
+        return binary
+    return json_path
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
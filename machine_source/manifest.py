@@ -0,0 +1,277 @@
+"""
+Manifest of the machine definition files under a source directory.
+
+The manifest keeps, for every directory, its modification time, its
+subdirectories and its machine files, and for every listed machine file
+its size, modification time, content hash and a summary of the machines
+it defines. Refreshing it only stats what it recorded: a directory is
+listed again when its modification time changed, and a file is read
+again when its size or modification time changed.
+
+Rebuild it from scratch with:
+
+    python -m machine_source.manifest [SOURCE_DIR]
+"""
+
+import json
+import os
+import sys
+
+from machine_source.cache import hash_file
+from machine_source.machine_format import BINARY_EXTENSION, prefer_binary, read_machine_header
+
+# ==== CONSTANTS ====
+SOURCE_DIR = "machine_source"
+# Kept with the caches, so saving it leaves the source directory unchanged
+MANIFEST_NAME = os.path.join(".cache", "manifest")
+MANIFEST_FORMAT = 1
+JSON_EXTENSION = ".json"
+SKIPPED_DIRECTORIES = ("__pycache__",)
+
+
+# ==== STORAGE ====
+
+
+def manifest_path(root=SOURCE_DIR):
+    """Return the manifest file of a source directory."""
+    return os.path.join(root, MANIFEST_NAME)
+
+
+def _empty_manifest():
+    return {"format": MANIFEST_FORMAT, "directories": {}, "files": {}}
+
+
+def load_manifest(root=SOURCE_DIR):
+    """Load the manifest of a source directory, or an empty one."""
+    try:
+        with open(manifest_path(root), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return _empty_manifest()
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        return _empty_manifest()
+    return manifest
+
+
+def save_manifest(manifest, root=SOURCE_DIR):
+    """Write a manifest atomically, so readers never see a partial file."""
+    path = manifest_path(root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    os.replace(temp_path, path)
+
+
+# ==== SUMMARIES ====
+
+
+def read_summaries(path):
+    """
+    Summarize the machines defined in a machine file.
+
+    Binary machines are summarized from their header alone.
+
+    :return: List of dicts with the machine type, index in its type's
+        list, name, initial state and state and transition counts.
+    """
+    if path.endswith(BINARY_EXTENSION):
+        header = read_machine_header(path)
+        return [{"type": header["type"], "index": 0, "name": header["name"],
+                 "initial_state": header["initial_state"],
+                 "states": header["states"], "transitions": header["transitions"]}]
+
+    with open(path, "r", encoding="utf-8") as file:
+        config_data = json.load(file)
+
+    summaries = []
+    for machine_type, machines_config in config_data.items():
+        if isinstance(machines_config, list):
+            for index, machine_config in enumerate(machines_config):
+                summaries.append({
+                    "type": machine_type,
+                    "index": index,
+                    "name": machine_config.get("name"),
+                    "initial_state": machine_config.get("initial_state"),
+                    "states": len(machine_config.get("states") or []),
+                    "transitions": len(machine_config.get("transitions") or []),
+                })
+    return summaries
+
+
+def _file_record(path, stat):
+    """
+    Read the manifest record of a machine file.
+
+    An unreadable file gets a record with its error and no machines, so
+    it is reported without being read again until it changes.
+    """
+    try:
+        machines = read_summaries(path)
+        digest = hash_file(path)
+    except json.JSONDecodeError as e:
+        return _error_record(stat, f"Error decoding JSON file: {e}")
+    except Exception as e:
+        return _error_record(stat, f"Error reading file: {e}")
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "hash": digest, "machines": machines}
+
+
+def _error_record(stat, error):
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "hash": None, "machines": [], "error": error}
+
+
+# ==== REFRESH ====
+
+
+def _scan_directory(directory):
+    """List the subdirectories and machine files of a directory."""
+    # Taken before listing, so a file added meanwhile forces another scan
+    mtime = os.stat(directory).st_mtime_ns
+    subdirectories, files = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or entry.name in SKIPPED_DIRECTORIES:
+                continue
+            if entry.is_dir():
+                subdirectories.append(entry.path)
+            elif entry.name.endswith((JSON_EXTENSION, BINARY_EXTENSION)):
+                files.append(entry.name)
+    return {"mtime_ns": mtime, "subdirectories": sorted(subdirectories), "files": sorted(files)}
+
+
+def _listed_files(directory, names):
+    """
+    Pick the files a directory's machines are loaded from.
+
+    A JSON machine whose binary twin is at least as recent is listed
+    through the binary file, which loads much faster; binary files older
+    than their JSON are ignored.
+
+    :return: List of (path, stat) pairs.
+    """
+    stats = {}
+    for name in names:
+        try:
+            stats[name] = os.stat(os.path.join(directory, name))
+        except OSError:
+            pass  # Removed since the listing; the directory is scanned again next time
+
+    listed = []
+    for name, stat in stats.items():
+        stem, extension = os.path.splitext(name)
+        if extension == JSON_EXTENSION:
+            binary = stats.get(stem + BINARY_EXTENSION)
+            if prefer_binary(stat, binary):
+                name, stat = stem + BINARY_EXTENSION, binary
+        elif stem + JSON_EXTENSION in stats:
+            continue
+        listed.append((os.path.join(directory, name), stat))
+    return listed
+
+
+def _refresh_directory(directory, record, old_files, files, rescan=False):
+    """
+    Refresh one directory's record and the records of its machine files.
+
+    :param directory: Directory to refresh.
+    :param record: Its previous record, or None.
+    :param old_files: File records of the previous manifest.
+    :param files: File records of the new manifest, filled in place.
+    :param rescan: List the directory even if it did not change.
+    :return: Tuple of (record, listed paths, whether anything was read
+        again), with a None record when the directory is gone.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return None, [], True
+
+    changed = False
+    if rescan or record is None or record["mtime_ns"] != mtime:
+        record = _scan_directory(directory)
+        changed = True
+
+    listed = []
+    for path, stat in _listed_files(directory, record["files"]):
+        file_record = old_files.get(path)
+        if file_record is None or file_record["size"] != stat.st_size or \
+                file_record["mtime_ns"] != stat.st_mtime_ns:
+            file_record = _file_record(path, stat)
+            changed = True
+        files[path] = file_record
+        listed.append(path)
+    return record, listed, changed
+
+
+def refresh_manifest(root=SOURCE_DIR, rebuild=False):
+    """
+    Bring the manifest of a source directory up to date and save it if it changed.
+
+    :param root: Source directory holding the manifest.
+    :param rebuild: Ignore the stored manifest and read every file again.
+    :return: List of (path, file record) pairs of the listed machine
+        files, directories first-to-last as a top-down walk visits them.
+        The records of unreadable files hold their "error".
+    """
+    root = os.path.normpath(root)
+    manifest = _empty_manifest() if rebuild else load_manifest(root)
+    directories, files, listed = {}, {}, []
+    changed = rebuild
+
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        record, paths, directory_changed = _refresh_directory(
+            directory, manifest["directories"].get(directory), manifest["files"], files)
+        changed = changed or directory_changed
+        listed.extend(paths)
+        if record is not None:
+            directories[directory] = record
+            pending.extend(reversed(record["subdirectories"]))
+
+    if changed or directories.keys() != manifest["directories"].keys() or \
+            files.keys() != manifest["files"].keys():
+        save_manifest({"format": MANIFEST_FORMAT, "directories": directories, "files": files}, root)
+
+    return [(path, files[path]) for path in listed]
+
+
+def rebuild_manifest(root=SOURCE_DIR):
+    """Rebuild the manifest of a source directory from every file."""
+    return refresh_manifest(root, rebuild=True)
+
+
+def record_generated(output_path, root=SOURCE_DIR):
+    """
+    Record a freshly written machine file in the manifest of root.
+
+    Nothing is written when root has no manifest yet or the file lies
+    outside root; the next refresh builds or catches up with it.
+
+    :param output_path: Path of the generated JSON or binary machine.
+    :param root: Source directory holding the manifest.
+    """
+    root = os.path.normpath(root)
+    directory = os.path.normpath(os.path.dirname(output_path))
+    absolute_root = os.path.abspath(root)
+    if not os.path.exists(manifest_path(root)) or \
+            os.path.commonpath([absolute_root, os.path.abspath(directory)]) != absolute_root:
+        return
+
+    manifest = load_manifest(root)
+    files = {path: record for path, record in manifest["files"].items()
+             if os.path.dirname(path) != directory}
+    record, _, _ = _refresh_directory(directory, manifest["directories"].get(directory),
+                                   manifest["files"], files, rescan=True)
+    if record is not None:
+        manifest["directories"][directory] = record
+    manifest["files"] = files
+    save_manifest(manifest, root)
+
+
+if __name__ == "__main__":
+    source_dir = sys.argv[1] if len(sys.argv) > 1 else SOURCE_DIR
+    listed = rebuild_manifest(source_dir)
+    print(f"Manifest of {source_dir} rebuilt with {len(listed)} machine files.")
@@ -0,0 +1,137 @@
+"""
+Counters and stage timers for the source generation pipeline.
+
+Instrumentation is opt-in: pipeline functions take ``metrics=None`` and
+only count or time when given a PipelineMetrics, so a disabled run pays
+for a handful of ``is None`` checks rather than per-row bookkeeping.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# ==== CONSTANTS ====
+METRICS_EXTENSION = ".metrics"
+STAGES = ("parse", "extract", "dedup", "write")
+# Trigger prefixes and the activity category they count towards
+TRIGGER_CATEGORIES = (
+    ("downloaded", "download"),
+    ("performed_", "search"),
+    ("searched_", "search"),
+    ("accessed_", "access"),
+    ("opened_", "access"),
+)
+OTHER_CATEGORY = "other"
+
+
+def trigger_category(trigger):
+    """Return the activity category a trigger counts towards."""
+    for prefix, category in TRIGGER_CATEGORIES:
+        if trigger.startswith(prefix):
+            return category
+    return OTHER_CATEGORY
+
+
+class PipelineMetrics:
+    """
+    Counters and per-stage timers of one source generation run.
+
+    Stage times of parallel extraction are summed over the workers, so
+    they measure work done rather than elapsed time.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.triggers = {}
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, stage, seconds):
+        self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def count_triggers(self, trigger_counts):
+        """Add matched rows counted per trigger."""
+        for trigger, value in trigger_counts.items():
+            self.triggers[trigger] = self.triggers.get(trigger, 0) + value
+
+    def rows_read(self):
+        """Return the rows read, those the source prefilter dropped included."""
+        return self.counters.get("rows_extracted", 0) + self.counters.get("rows_dropped_by_source", 0)
+
+    def merge(self, other):
+        """Add the counts and times of another run, e.g. a worker's chunk."""
+        for name, value in other.counters.items():
+            self.count(name, value)
+        for stage, seconds in other.timers.items():
+            self.add_time(stage, seconds)
+        self.count_triggers(other.triggers)
+
+    def categories(self):
+        """Return the matched rows per activity category."""
+        categories = {}
+        for trigger, value in self.triggers.items():
+            category = trigger_category(trigger)
+            categories[category] = categories.get(category, 0) + value
+        return categories
+
+    def to_dict(self):
+        counters = dict(self.counters)
+        counters["rows_read"] = self.rows_read()
+        return {
+            "counters": counters,
+            "matched_by_category": self.categories(),
+            "matched_by_trigger": dict(sorted(self.triggers.items())),
+            "seconds": {stage: self.timers.get(stage, 0.0)
+                        for stage in (*STAGES, *sorted(set(self.timers) - set(STAGES)))},
+        }
+
+    def report(self, title=None):
+        """Print the counters and stage times."""
+        data = self.to_dict()
+        counters = data["counters"]
+        if title:
+            print(f"\nPipeline metrics for {title}")
+
+        print(f"Rows read:              {counters['rows_read']:>10}")
+        print(f"Rows dropped by source: {counters.get('rows_dropped_by_source', 0):>10}")
+        print(f"Rows extracted:         {counters.get('rows_extracted', 0):>10}")
+        print(f"Rows matched:           {counters.get('rows_matched', 0):>10}")
+        for category, value in sorted(data["matched_by_category"].items()):
+            print(f"  {category + ':':<22}{value:>10}")
+        print(f"States:                 {counters.get('states', 0):>10}")
+        print(f"Transitions:            {counters.get('transitions', 0):>10}")
+        if counters.get("cached_extractions"):
+            print("Extraction:             cached")
+
+        total = sum(data["seconds"].values())
+        for stage, seconds in data["seconds"].items():
+            share = seconds / total if total else 0.0
+            print(f"{stage.capitalize() + ' time:':<24}{seconds:>9.3f}s ({share:.0%})")
+
+    def write(self, path):
+        """Write the metrics as JSON."""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+
+def stage_timer(metrics, stage):
+    """Time a stage when metrics are collected, and do nothing otherwise."""
+    if metrics is None:
+        return nullcontext()
+    return metrics.timer(stage)
+
+
+def metrics_path(output_json):
+    """Return the metrics file stored next to a generated machine."""
+    return f"{os.path.splitext(output_json)[0]}{METRICS_EXTENSION}"
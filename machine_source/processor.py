@@ -1,77 +1,1441 @@
+import bz2
 import csv
+import gzip
+import hashlib
+import io
 import json
+import lzma
 import os
+import pickle
+import re
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+from machine_source.cache import (PICKLE_ERRORS, cache_key, extractor_identity, load_extraction,
+                                  store_extraction)
+from machine_source.machine_format import binary_path, write_machine_arrays
+from machine_source.manifest import record_generated
+from machine_source.metrics import PipelineMetrics, metrics_path, stage_timer
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 # ==== CONSTANTS ====
 DELIMITER = ","
+ENCODING = "utf-8"
+QUOTE = b'"'
+BLOCK_SIZE = 1 << 16
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_SIZE = 1 << 20
+PARALLEL_MIN_SIZE = 64 << 20
+BATCH_ROWS = 1 << 16
+# Spaces per nesting level of generated JSON; None writes compact JSON
+JSON_INDENT = 4
+COMPRESSION_MAGIC = {
+    b"\x1f\x8b": gzip.open,
+    b"BZh": bz2.open,
+    b"\xfd7zXZ\x00": lzma.open,
+}
+COMPRESSION_EXTENSIONS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+CSV_FORMAT = "csv"
+JSONL_FORMAT = "jsonl"
+JSONL_EXTENSIONS = (".jsonl", ".json_line")
+TIMELINE_EXTENSIONS = tuple(f"{base}{ext}" for base in (".csv", *JSONL_EXTENSIONS)
+                            for ext in ("", *COMPRESSION_EXTENSIONS))
+# Fields of a psort json_line event kept for the extractors, with the
+# event keys they may be read from
+JSONL_FIELDS = {
+    "datetime": ("datetime",),
+    "timestamp_desc": ("timestamp_desc",),
+    "source": ("source", "source_short"),
+    "source_long": ("source_long",),
+    "message": ("message",),
+}
+MACHINE_TYPE = "WebActivityMachine"
+CHECKPOINT_EXTENSION = ".checkpoint"
+CHECKPOINT_SAMPLE_SIZE = 1 << 16
+
+
+# ==== INGEST ====
+
+
+def get_source_filter(extract_function):
+    """
+    Return the source filter declared by an extraction function.
+
+    Extractors opt into fast ingest by setting a ``sources`` attribute (and
+    optionally ``source_longs``) listing the plaso values they can match.
+
+    :param extract_function: Function to extract states and triggers.
+    :return: Tuple of (sources, source_longs) frozensets, or None.
+    """
+    sources = getattr(extract_function, "sources", None)
+    if not sources:
+        return None
+    source_longs = getattr(extract_function, "source_longs", None) or ()
+    return frozenset(sources), frozenset(source_longs)
+
+
+def combine_source_filters(source_filters):
+    """
+    Return the union of several source filters.
+
+    :param source_filters: Filters as returned by get_source_filter.
+    :return: Filter passing every row one of the filters passes, or None when
+        one of them reads every row.
+    """
+    if not source_filters or None in source_filters:
+        return None
+    sources = frozenset().union(*(sources for sources, _ in source_filters))
+    if not all(source_longs for _, source_longs in source_filters):
+        return sources, frozenset()
+    return sources, frozenset().union(*(source_longs for _, source_longs in source_filters))
+
+
+def _compressed_opener(input_csv):
+    """Return the open function of a compressed timeline, or None for plain files."""
+    with open(input_csv, "rb") as file:
+        head = file.read(6)
+    for magic, opener in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return opener
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(input_csv)[1].lower())
+
+
+def is_compressed(input_csv):
+    """Return whether a timeline is gzip, bz2 or xz compressed."""
+    return _compressed_opener(input_csv) is not None
+
+
+def is_timeline_file(filename):
+    """Return whether a file name looks like a plain or compressed CSV/JSONL timeline."""
+    return filename.lower().endswith(TIMELINE_EXTENSIONS)
+
+
+def timeline_stem(input_csv):
+    """Return a timeline file name without its format and compression extensions."""
+    name = os.path.basename(input_csv)
+    for ext in sorted(TIMELINE_EXTENSIONS, key=len, reverse=True):
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return os.path.splitext(name)[0]
+
+
+def open_timeline(input_csv):
+    """
+    Open a timeline for binary reading.
+
+    gzip, bz2 and xz files are detected by their magic bytes (or extension)
+    and decompressed on the fly, never to disk.
+    """
+    opener = _compressed_opener(input_csv)
+    if opener is None:
+        return open(input_csv, "rb")
+    return opener(input_csv, "rb")
+
+
+def _decode(line):
+    """Decode a raw line the way a text-mode file would have returned it."""
+    text = line.decode(ENCODING)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n")
+    return text
+
+
+def _read_blocks(file, quoted=True):
+    """
+    Yield raw blocks of whole records.
+
+    Every block ends on a newline (outside of any quoted field when
+    ``quoted``), so a record is never split between two blocks.
+    """
+    buffer = b""
+    while True:
+        data = file.read(BLOCK_SIZE)
+        if not data:
+            if buffer:
+                yield buffer
+            return
+
+        buffer += data
+        cut = buffer.rfind(b"\n") + 1
+        if cut == 0 or (quoted and buffer.count(QUOTE, 0, cut) % 2):
+            continue  # Inside a quoted field, keep reading
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+
+
+def _record_end(block, start, quoted=True):
+    """Return the offset just past the record that begins at ``start``."""
+    end = start
+    parity = 0
+    while True:
+        newline = block.find(b"\n", end)
+        if newline < 0:
+            return len(block)
+        if not quoted:
+            return newline + 1
+        parity += block.count(QUOTE, end, newline + 1)
+        end = newline + 1
+        if parity % 2 == 0:
+            return end
+
+
+def _matching_records(block, needles, quoted=True):
+    """Yield the raw records of a block that contain one of the needles."""
+    pos = 0
+    while True:
+        hits = [hit for hit in (block.find(needle, pos) for needle in needles)
+                if hit >= 0]
+        if not hits:
+            return
+        hit = min(hits)
+
+        start = block.rfind(b"\n", pos, hit) + 1 or pos
+        if quoted and block.count(QUOTE, pos, start) % 2:
+            # The hit is inside a multi-line record, walk records up to it
+            start = pos
+            while _record_end(block, start) <= hit:
+                start = _record_end(block, start)
+
+        pos = _record_end(block, start, quoted)
+        yield block[start:pos]
+
+
+def _count_records(data, quoted=True):
+    """Count the records in raw bytes that start on a record boundary."""
+    records = data.count(b"\n")
+    if quoted and QUOTE in data:
+        # Newlines inside quoted fields do not end a record
+        records -= sum(part.count(b"\n") for part in data.split(QUOTE)[1::2])
+    if data and not data.endswith(b"\n"):
+        records += 1
+    return records
+
+
+def _count_skipped(metrics, block, records, quoted=True):
+    """Count the records of a block outside the matching ones as dropped rows."""
+    kept = sum(_count_records(record, quoted) for record in records)
+    metrics.count("rows_dropped_by_source", _count_records(block, quoted) - kept)
+
+
+def _prefiltered_lines(file, needles, metrics=None):
+    """
+    Yield the decoded lines of records whose raw bytes contain a needle.
+
+    Blocks are searched for the needles directly, so records without one
+    are never split into lines, decoded or handed to the CSV parser.
+    """
+    for block in _read_blocks(file):
+        records = _matching_records(block, needles)
+        if metrics is not None:
+            records = list(records)
+            _count_skipped(metrics, block, records)
+        for record in records:
+            for line in record.splitlines(keepends=True):
+                yield _decode(line)
+
+
+def _source_needles(source_filter):
+    return [source.encode(ENCODING) for source in source_filter[0]]
+
+
+def _read_filtered_rows(file, header, source_filter, metrics=None):
+    """Yield row dicts for records whose source matches the filter."""
+    sources, source_longs = source_filter
+    needles = _source_needles(source_filter)
+
+    source_idx = header.index("source")
+    source_long_idx = header.index("source_long")
+    min_fields = max(source_idx, source_long_idx) + 1
+
+    dropped = 0
+    reader = csv.reader(_prefiltered_lines(file, needles, metrics), delimiter=DELIMITER)
+    for fields in reader:
+        if len(fields) < min_fields or fields[source_idx] not in sources:
+            dropped += 1
+            continue
+        if source_longs and fields[source_long_idx] not in source_longs:
+            dropped += 1
+            continue
+        yield dict(zip(header, fields))
+
+    if metrics is not None:
+        metrics.count("rows_dropped_by_source", dropped)
+
+
+def _project_event(event):
+    """Keep only the fields extractors read from a decoded JSON event."""
+    row = {}
+    for field, names in JSONL_FIELDS.items():
+        for name in names:
+            value = event.get(name)
+            if value is not None:
+                row[field] = value
+                break
+    return row
+
+
+def _read_jsonl_rows(file, source_filter=None, metrics=None):
+    """
+    Yield row dicts from psort json_line output.
+
+    Lines without one of the filter's sources are skipped before they are
+    decoded, and only the JSONL_FIELDS of each event are kept.
+    """
+    if source_filter:
+        sources, source_longs = source_filter
+        needles = _source_needles(source_filter)
+
+    dropped = 0
+    for block in _read_blocks(file, quoted=False):
+        if source_filter:
+            lines = _matching_records(block, needles, quoted=False)
+            if metrics is not None:
+                lines = list(lines)
+                _count_skipped(metrics, block, lines, quoted=False)
+        else:
+            lines = block.splitlines()
+
+        for line in lines:
+            if not line.strip():
+                continue
+            row = _project_event(json_loads(line))
+            if source_filter:
+                if row.get("source") not in sources:
+                    dropped += 1
+                    continue
+                if source_longs and row.get("source_long") not in source_longs:
+                    dropped += 1
+                    continue
+            yield row
+
+    if metrics is not None:
+        metrics.count("rows_dropped_by_source", dropped)
+
+
+def timeline_format(input_csv):
+    """
+    Return JSONL_FORMAT for psort json_line output and CSV_FORMAT otherwise.
+
+    The format is taken from the extension, or sniffed from the first byte
+    when the extension is not a known one.
+    """
+    name = os.path.basename(input_csv).lower()
+    if is_timeline_file(name):
+        extension = name[len(timeline_stem(name)):]
+        return JSONL_FORMAT if extension.startswith(JSONL_EXTENSIONS) else CSV_FORMAT
+
+    with open_timeline(input_csv) as file:
+        return JSONL_FORMAT if file.read(1) == b"{" else CSV_FORMAT
+
+
+def read_header(input_csv):
+    """
+    Return the CSV header fields and the byte offset of the first record.
+
+    JSONL timelines have no header; their records start at offset 0.
+    """
+    if timeline_format(input_csv) == JSONL_FORMAT:
+        return [], 0
+    with open_timeline(input_csv) as file:
+        line = file.readline()
+    return next(csv.reader([_decode(line)], delimiter=DELIMITER), []), len(line)
+
+
+def _has_source_columns(header, input_csv):
+    """Return whether the rows of a timeline carry source and source_long."""
+    if timeline_format(input_csv) == JSONL_FORMAT:
+        return True
+    return "source" in header and "source_long" in header
+
+
+def _usable_filter(header, source_filter, input_csv):
+    """Return the source filter if the timeline has the fields it needs."""
+    if not source_filter or _has_source_columns(header, input_csv):
+        return source_filter
+    print(f"No source columns in {input_csv}, reading every row.")
+    return None
+
+
+def _rows_from(file, input_format, header, source_filter, metrics=None):
+    """
+    Adapt the records of a binary stream to the row dicts extractors expect.
+
+    :param file: Binary stream positioned at the first record to read.
+    :param input_format: CSV_FORMAT or JSONL_FORMAT.
+    :param header: CSV header fields.
+    :param source_filter: Optional (sources, source_longs) filter.
+    :param metrics: Optional PipelineMetrics counting the dropped rows.
+    """
+    if input_format == JSONL_FORMAT:
+        yield from _read_jsonl_rows(file, source_filter, metrics)
+    elif source_filter:
+        yield from _read_filtered_rows(file, header, source_filter, metrics)
+    else:
+        text = io.TextIOWrapper(file, encoding=ENCODING)
+        yield from csv.DictReader(text, fieldnames=header, delimiter=DELIMITER)
+
+
+def read_rows(input_csv, source_filter=None, metrics=None):
+    """
+    Yield the rows of a plaso timeline as dicts.
+
+    :param input_csv: Path to the CSV or JSONL file, optionally
+        gzip/bz2/xz compressed.
+    :param source_filter: Optional (sources, source_longs) filter; rows from
+        other sources are skipped before they are parsed into dicts.
+    :param metrics: Optional PipelineMetrics counting the dropped rows;
+        rows skipped before parsing are counted by line.
+    """
+    input_format = timeline_format(input_csv)
+    header, _ = read_header(input_csv)
+    source_filter = _usable_filter(header, source_filter, input_csv)
+
+    with open_timeline(input_csv) as file:
+        if input_format == CSV_FORMAT:
+            file.readline()  # Skip the header
+        yield from _rows_from(file, input_format, header, source_filter, metrics)
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only raw stream over the bytes [start, end) of a file."""
+
+    def __init__(self, path, start, end):
+        super().__init__()
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def read_row_range(input_csv, header, start, end, source_filter=None, metrics=None):
+    """
+    Yield the rows stored in a byte range of a timeline as dicts.
+
+    :param input_csv: Path to the CSV or JSONL file.
+    :param header: Header fields of the file.
+    :param start: Offset of the first record in the range.
+    :param end: Offset just past the last record in the range.
+    :param source_filter: Optional (sources, source_longs) filter.
+    :param metrics: Optional PipelineMetrics counting the dropped rows.
+    """
+    input_format = timeline_format(input_csv)
+    with io.BufferedReader(_ByteRange(input_csv, start, end)) as file:
+        yield from _rows_from(file, input_format, header, source_filter, metrics)
+
+
+def chunk_offsets(input_csv, start, chunks, quoted=True):
+    """
+    Split the records after ``start`` into byte ranges on record boundaries.
+
+    Quote parity is tracked from ``start``, so a boundary never falls
+    inside a quoted multi-line field.
+
+    :param input_csv: Path to the CSV file.
+    :param start: Offset of the first record.
+    :param chunks: Number of ranges to aim for.
+    :param quoted: Whether records may span lines inside quotes (CSV); JSONL
+        records always end at a newline.
+    :return: Sorted offsets; consecutive pairs delimit one range.
+    """
+    size = os.path.getsize(input_csv)
+    step = max((size - start) // max(chunks, 1), MIN_CHUNK_SIZE)
+    offsets = [start]
+    position = start
+    parity = 0
+
+    with open(input_csv, "rb") as file:
+        file.seek(start)
+        while offsets[-1] + step < size:
+            target = offsets[-1] + step
+            while position < target:
+                data = file.read(min(BLOCK_SIZE, target - position))
+                if quoted:
+                    parity += data.count(QUOTE)
+                position += len(data)
+
+            # Move on to the first line end outside a quoted field
+            for line in iter(file.readline, b""):
+                if quoted:
+                    parity += line.count(QUOTE)
+                position += len(line)
+                if parity % 2 == 0:
+                    break
+
+            if position >= size:
+                break
+            offsets.append(position)
+
+    offsets.append(size)
+    return offsets
+
+
+# ==== STATE TABLE ====
+
+
+class StateTable:
+    """
+    Interned states and triggers with a compact integer edge store.
+
+    States and triggers map to integer ids in first-seen order, and every
+    distinct transition is kept once as a (source, dest, trigger) id triple
+    in parallel arrays, so memory grows linearly with the machine size.
+    """
+
+    # Rows read from the file, prefiltered ones included, when the
+    # extraction that built the table counted them
+    rows_read = None
+
+    def __init__(self):
+        self.state_ids = {}
+        self.trigger_ids = {}
+        self.edge_sources = array("I")
+        self.edge_dests = array("I")
+        self.edge_triggers = array("I")
+        self._edge_keys = set()
+        self.previous_state = None
+        self._previous_id = None
+        self.rows = 0
+        self.matched = 0
+        self.first = None
+
+    def __len__(self):
+        return len(self.state_ids)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_edge_keys"]  # Rebuilt from the edge arrays
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._edge_keys = {
+            (source << 64) | (dest << 32) | trigger
+            for source, dest, trigger in zip(
+                self.edge_sources, self.edge_dests, self.edge_triggers)}
+
+    @staticmethod
+    def _intern(table, value):
+        value_id = table.get(value)
+        if value_id is None:
+            value_id = table[value] = len(table)
+        return value_id
+
+    def add(self, state, trigger):
+        """Record a state reached through a trigger from the previous state."""
+        self.matched += 1
+        if self.first is None:
+            self.first = (state, trigger)
+        state_id = self._intern(self.state_ids, state)
+
+        if self.previous_state and self._previous_id != state_id:
+            self.add_edge(self._previous_id, state_id,
+                          self._intern(self.trigger_ids, trigger))
+
+        self.previous_state = state
+        self._previous_id = state_id
+
+    def add_edge(self, source_id, dest_id, trigger_id):
+        """Store a transition between interned ids unless it is known already."""
+        key = (source_id << 64) | (dest_id << 32) | trigger_id
+        if key in self._edge_keys:
+            return
+        self._edge_keys.add(key)
+        self.edge_sources.append(source_id)
+        self.edge_dests.append(dest_id)
+        self.edge_triggers.append(trigger_id)
+
+    def merge(self, other):
+        """
+        Append a table extracted from the records that follow this one's.
+
+        The previous state is stitched to the other table's first state the
+        same way a sequential pass would have, and the other table's states
+        and triggers keep their first-seen order after this table's, the
+        stitched trigger first, so chunked extraction writes the same
+        machine as a single pass.
+        """
+        state_map = [self._intern(self.state_ids, state)
+                     for state in other.state_ids]
+
+        if other.first is not None:
+            first_state, first_trigger = other.first
+            first_id = state_map[other.state_ids[first_state]]
+            if self.previous_state and self._previous_id != first_id:
+                self.add_edge(self._previous_id, first_id,
+                              self._intern(self.trigger_ids, first_trigger))
+            if self.first is None:
+                self.first = other.first
+            self.previous_state = other.previous_state
+            self._previous_id = state_map[other._previous_id]
+
+        # Interned after the stitched trigger, as a sequential pass would
+        trigger_map = [self._intern(self.trigger_ids, trigger)
+                       for trigger in other.trigger_ids]
+        for source, dest, trigger in zip(
+                other.edge_sources, other.edge_dests, other.edge_triggers):
+            self.add_edge(state_map[source], state_map[dest],
+                          trigger_map[trigger])
+
+        self.rows += other.rows
+        self.matched += other.matched
+
+    def states(self):
+        """Return the states in first-seen order."""
+        return list(self.state_ids)
+
+    def transitions(self):
+        """Return the transitions as sorted (source, dest, trigger) tuples."""
+        states = self.states()
+        triggers = list(self.trigger_ids)
+        return sorted(
+            (states[source], states[dest], triggers[trigger])
+            for source, dest, trigger in zip(
+                self.edge_sources, self.edge_dests, self.edge_triggers))
+
+
+# ==== EXTRACTION ====
+
+
+def _fill_table_batches(table, rows, batch_function, metrics=None):
+    """Feed rows through a column-wise extraction function, BATCH_ROWS at a time."""
+    fields = batch_function.fields
+    rows_before = table.rows
+    trigger_counts = {}
+    rows = iter(rows)
+    while True:
+        with stage_timer(metrics, "parse"):
+            batch = list(islice(rows, BATCH_ROWS))
+        if not batch:
+            break
+        table.rows += len(batch)
+
+        with stage_timer(metrics, "extract"):
+            columns = {field: [row.get(field) for row in batch] for field in fields}
+            states, triggers = batch_function(columns)
+        with stage_timer(metrics, "dedup"):
+            for state, trigger in zip(states, triggers):
+                if state is not None:
+                    table.add(state, trigger)
+                    trigger_counts[trigger] = trigger_counts.get(trigger, 0) + 1
+
+    if metrics is not None:
+        metrics.count("rows_extracted", table.rows - rows_before)
+        metrics.count("rows_matched", sum(trigger_counts.values()))
+        metrics.count_triggers(trigger_counts)
+    return table
+
+
+def _fill_table_timed(table, rows, extract_function, metrics):
+    """
+    Feed rows into a StateTable like _fill_table while timing each stage.
+
+    Waiting on the row iterator counts as parsing, the extraction function
+    call as extraction and StateTable.add as dedup.
+    """
+    clock = time.perf_counter
+    parse = extract = dedup = 0.0
+    extracted = 0
+    trigger_counts = {}
+
+    rows = iter(rows)
+    while True:
+        started = clock()
+        row = next(rows, None)
+        parsed = clock()
+        parse += parsed - started
+        if row is None:
+            break
+        extracted += 1
+
+        extracted_data = extract_function(row)
+        done = clock()
+        extract += done - parsed
+        if not extracted_data:
+            continue
+
+        state, trigger = extracted_data  # Extract state & trigger
+        table.add(state, trigger)
+        dedup += clock() - done
+        trigger_counts[trigger] = trigger_counts.get(trigger, 0) + 1
+
+    table.rows += extracted
+    metrics.add_time("parse", parse)
+    metrics.add_time("extract", extract)
+    metrics.add_time("dedup", dedup)
+    metrics.count("rows_extracted", extracted)
+    metrics.count("rows_matched", sum(trigger_counts.values()))
+    metrics.count_triggers(trigger_counts)
+    return table
+
+
+def _fill_table(table, rows, extract_function, vectorized=True, metrics=None):
+    """
+    Feed rows through the extraction function into a StateTable.
+
+    :param vectorized: Use the extractor's column-wise ``batch`` variant
+        when it declares one.
+    :param metrics: Optional PipelineMetrics to count rows and time stages.
+    """
+    batch_function = getattr(extract_function, "batch", None) if vectorized else None
+    if batch_function is not None:
+        return _fill_table_batches(table, rows, batch_function, metrics)
+    if metrics is not None:
+        return _fill_table_timed(table, rows, extract_function, metrics)
+
+    for row in rows:
+        table.rows += 1
+
+        extracted_data = extract_function(row)
+        if not extracted_data:
+            continue
+
+        state, trigger = extracted_data  # Extract state & trigger
+        table.add(state, trigger)
+
+    return table
+
+
+def _extract_range(args):
+    input_csv, header, start, end, extract_function, source_filter, vectorized, instrument = args
+    metrics = PipelineMetrics() if instrument else None
+    rows = read_row_range(input_csv, header, start, end, source_filter, metrics)
+    return _fill_table(StateTable(), rows, extract_function, vectorized, metrics), metrics
 
 
-def extract_states_and_transitions(input_csv, extract_function):
-    """Extract states, transitions, and triggers using the provided extraction function."""
-    states = []
-    transitions = set()
-    previous_state = None
+def _extract_table_parallel(input_csv, extract_function, source_filter, workers, vectorized,
+                            metrics=None):
+    header, start = read_header(input_csv)
+    source_filter = _usable_filter(header, source_filter, input_csv)
+    quoted = timeline_format(input_csv) == CSV_FORMAT
+    offsets = chunk_offsets(input_csv, start, workers * CHUNKS_PER_WORKER, quoted)
+    jobs = [(input_csv, header, chunk_start, chunk_end, extract_function, source_filter,
+             vectorized, metrics is not None)
+            for chunk_start, chunk_end in zip(offsets, offsets[1:])]
 
-    with open(input_csv, "r", encoding="utf-8") as file:
-        reader = csv.DictReader(file, delimiter=DELIMITER)
+    if len(jobs) == 1:
+        table, part_metrics = _extract_range(jobs[0])
+        if metrics is not None:
+            metrics.merge(part_metrics)
+        return table
 
-        for row in reader:
+    table = StateTable()
+    # Chunks come back in file order, so merging them one by one restores
+    # the sequential first-seen order and stitches the chunk boundaries
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for part, part_metrics in executor.map(_extract_range, jobs):
+            if metrics is not None:
+                metrics.merge(part_metrics)
+            with stage_timer(metrics, "dedup"):
+                table.merge(part)
+    return table
+
+
+def extract_table(input_csv, extract_function, prefilter=True, workers=1, vectorized=True,
+                  metrics=None):
+    """
+    Extract a StateTable using the provided extraction function.
+
+    :param input_csv: Path to the CSV file.
+    :param extract_function: Function to extract states and triggers.
+    :param prefilter: Skip rows outside the extractor's declared sources.
+    :param workers: Number of processes; above 1 the file is split into
+        record-aligned byte ranges that are extracted in parallel. Compressed
+        files cannot be split and are always read by one process.
+    :param vectorized: Use the extractor's column-wise variant if it has one.
+    :param metrics: Optional PipelineMetrics to count rows and time stages.
+    """
+    source_filter = get_source_filter(extract_function) if prefilter else None
+
+    if workers > 1 and not is_compressed(input_csv):
+        return _extract_table_parallel(input_csv, extract_function,
+                                       source_filter, workers, vectorized, metrics)
+
+    rows = read_rows(input_csv, source_filter, metrics)
+    return _fill_table(StateTable(), rows, extract_function, vectorized, metrics)
+
+
+def extract_states_and_transitions(input_csv, extract_function, prefilter=True, workers=1):
+    """
+    Extract states, transitions, and triggers using the provided extraction function.
+
+    :param input_csv: Path to the CSV file.
+    :param extract_function: Function to extract states and triggers.
+    :param prefilter: Skip rows outside the extractor's declared sources.
+    :param workers: Number of processes to extract with.
+    """
+    table = extract_table(input_csv, extract_function, prefilter, workers)
+    return table.states(), table.transitions()
+
+
+def _fill_tables(tables, rows, extract_functions, source_filters):
+    """
+    Feed every row to each extraction function whose source filter passes it.
+
+    Each table ends up as if its function had been run alone with its own
+    filter, including the row count.
+    """
+    consumers = list(zip(tables, extract_functions, source_filters))
+    for row in rows:
+        source = row.get("source")
+        source_long = row.get("source_long")
+
+        for table, extract_function, source_filter in consumers:
+            if source_filter:
+                sources, source_longs = source_filter
+                if source not in sources or (source_longs and source_long not in source_longs):
+                    continue
+            table.rows += 1
 
             extracted_data = extract_function(row)
             if not extracted_data:
                 continue
 
             state, trigger = extracted_data  # Extract state & trigger
-            if state not in states:
-                states.append(state)
+            table.add(state, trigger)
+
+    return tables
+
+
+def _extract_ranges(args):
+    input_csv, header, start, end, extract_functions, source_filters = args
+    rows = read_row_range(input_csv, header, start, end,
+                          combine_source_filters(source_filters))
+    tables = [StateTable() for _ in extract_functions]
+    return _fill_tables(tables, rows, extract_functions, source_filters)
+
+
+def extract_tables(input_csv, extract_functions, prefilter=True, workers=1):
+    """
+    Extract one StateTable per extraction function from a single read.
+
+    Rows are read and parsed once, pre-filtered on the union of the
+    functions' declared sources, and handed to every function whose own
+    filter they pass, so each table matches what extract_table would return
+    for that function alone.
+
+    :param input_csv: Path to the CSV file.
+    :param extract_functions: Functions to extract states and triggers.
+    :param prefilter: Skip rows outside the functions' declared sources.
+    :param workers: Number of processes, as for extract_table.
+    :return: List of StateTables in the order of extract_functions.
+    """
+    header, start = read_header(input_csv)
+    source_filters = [get_source_filter(extract_function) if prefilter else None
+                      for extract_function in extract_functions]
+    if any(source_filters) and not _has_source_columns(header, input_csv):
+        print(f"No source columns in {input_csv}, reading every row.")
+        source_filters = [None] * len(extract_functions)
+
+    if workers > 1 and not is_compressed(input_csv):
+        quoted = timeline_format(input_csv) == CSV_FORMAT
+        offsets = chunk_offsets(input_csv, start, workers * CHUNKS_PER_WORKER, quoted)
+        jobs = [(input_csv, header, chunk_start, chunk_end, extract_functions, source_filters)
+                for chunk_start, chunk_end in zip(offsets, offsets[1:])]
+        if len(jobs) == 1:
+            return _extract_ranges(jobs[0])
+
+        tables = [StateTable() for _ in extract_functions]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for parts in executor.map(_extract_ranges, jobs):
+                for table, part in zip(tables, parts):
+                    table.merge(part)
+        return tables
+
+    rows = read_rows(input_csv, combine_source_filters(source_filters))
+    tables = [StateTable() for _ in extract_functions]
+    return _fill_tables(tables, rows, extract_functions, source_filters)
+
+
+def cached_extract_table(input_csv, extract_function, workers=1, use_cache=True, metrics=None):
+    """
+    Extract a StateTable, reusing a cached result for unchanged input.
+
+    The cache key combines the input file digest with the extractor's
+    module, name and ``version`` attribute.
+
+    :param metrics: Optional PipelineMetrics; a cache hit is counted as
+        cached_extractions and has no parse or extract time. When given,
+        the rows read are kept on the table as rows_read and cached with it.
+    :return: Tuple of (table, cache_hit).
+    """
+    if not use_cache:
+        return extract_table(input_csv, extract_function, workers=workers, metrics=metrics), False
+
+    key = cache_key(input_csv, extract_function)
+    table = load_extraction(key)
+    if table is not None:
+        print(f"Using cached extraction for {input_csv}")
+        if metrics is not None:
+            metrics.count("cached_extractions")
+        return table, True
+
+    read_before = metrics.rows_read() if metrics is not None else 0
+    table = extract_table(input_csv, extract_function, workers=workers, metrics=metrics)
+    if metrics is not None:
+        table.rows_read = metrics.rows_read() - read_before
+    store_extraction(key, table)
+    return table, False
+
+
+# ==== OUTPUT ====
+
+
+def _rank_order(values):
+    """Return the indices of values in sorted order and the rank of every index."""
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = array("I", bytes(4 * len(order)))
+    for rank, idx in enumerate(order):
+        ranks[idx] = rank
+    return order, ranks
+
+
+def sorted_edges(table):
+    """
+    Return the edges of a StateTable in the order of table.transitions().
+
+    Edges are sorted on one integer per edge built from the sort ranks of
+    their state and trigger strings, so no string tuples are built.
+
+    :return: Tuple of (sources, dests, triggers) id arrays.
+    """
+    state_order, state_ranks = _rank_order(table.states())
+    trigger_order, trigger_ranks = _rank_order(list(table.trigger_ids))
+    state_count, trigger_count = len(state_order), max(len(trigger_order), 1)
+
+    keys = sorted(
+        (state_ranks[source] * state_count + state_ranks[dest]) * trigger_count + trigger_ranks[trigger]
+        for source, dest, trigger in zip(
+            table.edge_sources, table.edge_dests, table.edge_triggers))
+
+    sources, dests, triggers = array("I"), array("I"), array("I")
+    for key in keys:
+        key, trigger = divmod(key, trigger_count)
+        source, dest = divmod(key, state_count)
+        sources.append(state_order[source])
+        dests.append(state_order[dest])
+        triggers.append(trigger_order[trigger])
+    return sources, dests, triggers
+
+
+def write_machine_json(output_json, name, table, edges, indent=JSON_INDENT):
+    """
+    Stream the machine of a StateTable to JSON.
+
+    States, triggers and transitions are written one at a time from the
+    table ids, so the definition is never held in memory as lists of dicts.
+    With an indent the file is the same as json.dump would write; with
+    indent None it is compact JSON without whitespace.
+
+    :param output_json: Path of the JSON file.
+    :param name: Machine name.
+    :param table: StateTable holding the extracted states and transitions.
+    :param edges: Edge id arrays from sorted_edges.
+    :param indent: Spaces per nesting level, or None for compact output.
+    """
+    states, trigger_names = table.states(), list(table.trigger_ids)
+    sources, dests, triggers = edges
+    quote = encode_basestring_ascii
+    key_separator = ":" if indent is None else ": "
+
+    def pad(level):
+        return "" if indent is None else "\n" + " " * (indent * level)
+
+    def write_list(file, level, items):
+        """Write items as a JSON array nested at level."""
+        opening = "["
+        for item in items:
+            file.write(opening + pad(level + 1) + item)
+            opening = ","
+        file.write("[]" if opening == "[" else pad(level) + "]")
+
+    def field(key):
+        return pad(3) + quote(key) + key_separator
+
+    transition_keys = [pad(5) + quote(key) + key_separator for key in ("trigger", "source", "dest")]
+    transition_end = pad(4) + "}"
+
+    def transition_items():
+        for source, dest, trigger in zip(sources, dests, triggers):
+            yield ("{" + transition_keys[0] + quote(trigger_names[trigger]) + "," +
+                   transition_keys[1] + quote(states[source]) + "," +
+                   transition_keys[2] + quote(states[dest]) + transition_end)
+
+    with open(output_json, "w", encoding="utf-8") as json_file:
+        json_file.write("{" + pad(1) + quote(MACHINE_TYPE) + key_separator + "[" + pad(2) + "{")
+        json_file.write(field("name") + quote(name) + ",")
+        json_file.write(field("initial_state") + quote(states[0] if states else "unknown") + ",")
+        json_file.write(field("states"))
+        write_list(json_file, 3, map(quote, states))
+        # Triggers in the order they first appear in the sorted transitions
+        json_file.write("," + field("triggers"))
+        write_list(json_file, 3, (quote(trigger_names[trigger])
+                                  for trigger in dict.fromkeys(triggers)))
+        json_file.write("," + field("transitions"))
+        write_list(json_file, 3, transition_items())
+        json_file.write("," + field("functions") + "{}" + pad(2) + "}" + pad(1) + "]" + pad(0) + "}")
+
+    print(f"JSON saved to {output_json}")
+
+
+def write_machine_binary(output_path, name, table, edges):
+    """Write the machine of a StateTable in the compact binary format."""
+    states = table.states()
+    trigger_names = list(table.trigger_ids)
+    sources, dests, triggers = edges
+
+    # Triggers are interned after the states in JSON order, as encode_machine does
+    strings = list(states)
+    string_ids = dict(table.state_ids)
+    trigger_order = list(dict.fromkeys(triggers))
+    trigger_strings = array("I", bytes(4 * len(trigger_names)))
+    for trigger in trigger_order:
+        trigger_name = trigger_names[trigger]
+        string_id = string_ids.get(trigger_name)
+        if string_id is None:
+            string_id = string_ids[trigger_name] = len(strings)
+            strings.append(trigger_name)
+        trigger_strings[trigger] = string_id
+
+    trigger_ids = [trigger_strings[trigger] for trigger in trigger_order]
+    write_machine_arrays(output_path, MACHINE_TYPE, name, states[0] if states else "unknown",
+                         strings, len(states), trigger_ids, sources, dests,
+                         array("I", (trigger_strings[trigger] for trigger in triggers)))
+
+
+def write_machine_files(output_json, name, table, indent=JSON_INDENT):
+    """
+    Write the machine of a StateTable as JSON plus its binary twin.
+
+    :param output_json: Path of the JSON file; the binary file sits next to it.
+    :param name: Machine name.
+    :param table: StateTable holding the extracted states and transitions.
+    :param indent: JSON indent, or None for compact JSON.
+    :return: Tuple of (state count, transition count).
+    """
+    edges = sorted_edges(table)
+    write_machine_json(output_json, name, table, edges, indent)
+    write_machine_binary(binary_path(output_json), name, table, edges)
+    return len(table.state_ids), len(edges[0])
+
+
+# ==== CHECKPOINTS ====
+
+
+def checkpoint_path(output_json):
+    """Return the path of the checkpoint stored next to a generated machine."""
+    return f"{os.path.splitext(output_json)[0]}{CHECKPOINT_EXTENSION}"
 
-            if previous_state and previous_state != state:
-                transitions.add((previous_state, state, trigger))
 
-            previous_state = state
+def _sample_digest(input_csv, start, end):
+    """Return the SHA-256 digest of the bytes [start, end) of a file."""
+    with open(input_csv, "rb") as file:
+        file.seek(start)
+        return hashlib.sha256(file.read(end - start)).hexdigest()
 
-    return states, sorted(transitions)
 
+def _input_signature(input_csv, offset):
+    """Fingerprint the start of a file and the bytes just before ``offset``."""
+    if offset is None:
+        return None
+    return (_sample_digest(input_csv, 0, min(offset, CHECKPOINT_SAMPLE_SIZE)),
+            _sample_digest(input_csv, max(offset - CHECKPOINT_SAMPLE_SIZE, 0), offset))
 
-def generate_json(input_csv, output_dir, extract_function, prefix):
+
+def save_checkpoint(output_json, input_csv, extract_function, name, table, offset):
+    """
+    Store what is needed to extend a machine with rows appended to its CSV.
+
+    :param output_json: Path of the generated JSON.
+    :param input_csv: Path to the CSV file it was generated from.
+    :param extract_function: Function used to extract states and triggers.
+    :param name: Machine name.
+    :param table: StateTable holding the state after the last processed row.
+    :param offset: Number of CSV bytes processed so far, or None when the
+        input cannot be resumed (compressed timelines).
+    """
+    header = {
+        "input": os.path.abspath(input_csv),
+        "extractor": extractor_identity(extract_function),
+        "name": name,
+        "offset": offset,
+        "signature": _input_signature(input_csv, offset),
+    }
+    with open(checkpoint_path(output_json), "wb") as file:
+        # The header is a pickle of its own, so it can be read without the table
+        pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(table, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_checkpoint(output_json, with_table=True):
+    """
+    Return the checkpoint of a generated machine, or None if it has none.
+
+    :param output_json: Path of the generated JSON.
+    :param with_table: Also read the StateTable, as "table"; without it
+        only the small header before it is read.
+    """
+    try:
+        with open(checkpoint_path(output_json), "rb") as file:
+            checkpoint = pickle.load(file)
+            if not isinstance(checkpoint, dict):
+                return None
+            # Checkpoints of older versions hold the table in the header
+            if with_table and "table" not in checkpoint:
+                checkpoint["table"] = pickle.load(file)
+            return checkpoint
+    except PICKLE_ERRORS:
+        return None
+
+
+def find_checkpoint(input_csv, output_dir, prefix):
+    """Return the newest machine JSON generated from a CSV, or None."""
+    output_subdir = os.path.join(output_dir, prefix)
+    if not os.path.isdir(output_subdir):
+        return None
+
+    input_path = os.path.abspath(input_csv)
+    matches = []
+    for filename in os.listdir(output_subdir):
+        if not filename.endswith(CHECKPOINT_EXTENSION):
+            continue
+        output_json = os.path.join(output_subdir,
+                                   f"{os.path.splitext(filename)[0]}.json")
+        checkpoint = load_checkpoint(output_json, with_table=False)
+        if checkpoint and checkpoint.get("input") == input_path and os.path.exists(output_json):
+            matches.append(output_json)
+
+    return max(matches, key=os.path.getmtime, default=None)
+
+
+def _appended_range(checkpoint, input_csv, extract_function):
+    """
+    Return the byte range of rows added to a CSV since a checkpoint.
+
+    Returns None when the checkpoint cannot be resumed: another extractor,
+    a compressed timeline, a file that shrank, a checkpoint that stopped mid-record, or earlier
+    content that no longer matches.
+    """
+    offset = checkpoint["offset"]
+    if checkpoint["extractor"] != extractor_identity(extract_function):
+        return None
+    if offset is None or is_compressed(input_csv):
+        return None
+
+    size = os.path.getsize(input_csv)
+    if size < offset or offset == 0:
+        return None
+    with open(input_csv, "rb") as file:
+        file.seek(offset - 1)
+        if file.read(1) != b"\n":
+            return None
+    if _input_signature(input_csv, offset) != checkpoint["signature"]:
+        return None
+    return offset, size
+
+
+def update_json(output_json, extract_function, input_csv=None):
+    """
+    Extend a generated machine with the rows appended to its CSV.
+
+    Only the bytes after the checkpoint offset are read, and the machine
+    JSON and checkpoint are updated in place. Falls back to a full
+    extraction when the checkpoint cannot be resumed.
+
+    :param output_json: Path of the generated JSON.
+    :param extract_function: Function used to extract states and triggers.
+    :param input_csv: CSV to read; defaults to the one the machine came from.
+    :return: Summary dict like generate_json, or None without a checkpoint.
+    """
+    start = time.perf_counter()
+    checkpoint = load_checkpoint(output_json)
+    if checkpoint is None:
+        print(f"No checkpoint found for {output_json}.")
+        return None
+
+    input_csv = input_csv or checkpoint["input"]
+    name = checkpoint["name"]
+    appended = _appended_range(checkpoint, input_csv, extract_function)
+
+    if appended is None:
+        print(f"Cannot resume {output_json}, extracting {input_csv} again.")
+        offset = None if is_compressed(input_csv) else os.path.getsize(input_csv)
+        table = extract_table(input_csv, extract_function)
+    else:
+        table = checkpoint["table"]
+        offset = appended[1]
+        header, _ = read_header(input_csv)
+        source_filter = _usable_filter(
+            header, get_source_filter(extract_function), input_csv)
+        rows = read_row_range(input_csv, header, *appended, source_filter)
+        _fill_table(table, rows, extract_function)
+        print(f"Processed {appended[1] - appended[0]} new bytes of {input_csv}")
+
+    state_count, transition_count = write_machine_files(output_json, name, table)
+    save_checkpoint(output_json, input_csv, extract_function, name, table, offset)
+    record_generated(output_json)
+
+    return {
+        "input": input_csv,
+        "output": output_json,
+        "rows_extracted": table.rows,
+        "matched": table.matched,
+        "states": state_count,
+        "transitions": transition_count,
+        "seconds": time.perf_counter() - start,
+        "cached": False,
+    }
+
+
+# ==== GENERATION ====
+
+
+def generate_json(input_csv, output_dir, extract_function, prefix, name=None, workers=None,
+                  use_cache=True, report_metrics=False, write_metrics=False, compact=False,
+                  collect_metrics=False):
     """
     Generate a JSON file using the given extraction function.
 
+    A checkpoint is saved next to the JSON so that update_json can later
+    extend the machine with rows appended to the CSV, and the machine is
+    recorded in the machine_source manifest when it is written there.
+
     :param input_csv: Path to the CSV file.
     :param output_dir: Directory to save the JSON.
     :param extract_function: Function to extract states and triggers.
     :param prefix: Prefix for the JSON filename.
+    :param name: Machine and file name; defaults to the prefix and current time.
+    :param workers: Extraction processes; defaults to every core for files
+        of at least PARALLEL_MIN_SIZE bytes and one otherwise.
+    :param use_cache: Reuse the extraction of an unchanged CSV.
+    :param report_metrics: Count rows and time the pipeline stages, and
+        print the report at the end.
+    :param write_metrics: Collect the same metrics and write them as JSON
+        to a METRICS_EXTENSION file next to the output.
+    :param compact: Write the JSON without indentation.
+    :param collect_metrics: Collect the same metrics for the summary only.
+    :return: Summary dict with the output path, read row, extracted row,
+        matched row, state and transition counts and the elapsed time, plus
+        the metrics when collected. Rows read is None unless metrics were
+        collected by this or the cached extraction.
+    """
+    start = time.perf_counter()
+    if name is None:
+        name = _default_name(prefix)
+    workers, offset = _input_plan(input_csv, workers)
+    metrics = PipelineMetrics() if report_metrics or write_metrics or collect_metrics else None
+
+    table, cached = cached_extract_table(
+        input_csv, extract_function, workers, use_cache, metrics)
+
+    summary = _save_generated(input_csv, output_dir, extract_function, prefix, name,
+                              table, offset, cached, start, metrics, compact)
+    if metrics is not None:
+        if report_metrics:
+            metrics.report(summary["output"])
+        if write_metrics:
+            output_metrics = metrics_path(summary["output"])
+            metrics.write(output_metrics)
+            print(f"Metrics saved to {output_metrics}")
+        summary["metrics"] = metrics.to_dict()
+    return summary
+
+
+def generate_jsons(input_csv, output_dir, extractors, workers=None, use_cache=True, compact=False):
     """
-    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+    Generate one JSON per extraction function from a single read of the CSV.
 
+    Every extractor gets the machine generate_json would have produced for
+    it, in its own prefix subdirectory, while the CSV is read and parsed
+    once for all of those without a cached extraction.
+
+    :param input_csv: Path to the CSV file.
+    :param output_dir: Directory to save the JSONs.
+    :param extractors: List of (extract_function, prefix) pairs.
+    :param workers: Extraction processes, as for generate_json.
+    :param use_cache: Reuse the extractions of an unchanged CSV.
+    :param compact: Write the JSONs without indentation.
+    :return: List of summary dicts in the order of extractors.
+    """
+    start = time.perf_counter()
+    workers, offset = _input_plan(input_csv, workers)
+
+    tables, cached, missing = [], [], []
+    for extract_function, prefix in extractors:
+        table = load_extraction(cache_key(input_csv, extract_function)) if use_cache else None
+        if table is None:
+            missing.append(len(tables))
+        else:
+            print(f"Using cached extraction for {input_csv} ({prefix})")
+        tables.append(table)
+        cached.append(table is not None)
+
+    if missing:
+        functions = [extractors[idx][0] for idx in missing]
+        for idx, table in zip(missing, extract_tables(input_csv, functions, workers=workers)):
+            tables[idx] = table
+            if use_cache:
+                store_extraction(cache_key(input_csv, extractors[idx][0]), table)
+
+    return [_save_generated(input_csv, output_dir, extract_function, prefix,
+                            _default_name(prefix), table, offset, hit, start, compact=compact)
+            for (extract_function, prefix), table, hit in zip(extractors, tables, cached)]
+
+
+def _default_name(prefix):
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+def _input_plan(input_csv, workers):
+    """
+    Return the worker count and checkpoint offset for generating from a CSV.
+
+    Workers default to every core for files of at least PARALLEL_MIN_SIZE
+    bytes and one otherwise; compressed input has no resumable offset.
+    """
+    size = os.path.getsize(input_csv)
+    if workers is None:
+        workers = (os.cpu_count() or 1) if size >= PARALLEL_MIN_SIZE else 1
+    offset = None if is_compressed(input_csv) else size
+    return workers, offset
+
+
+def _save_generated(input_csv, output_dir, extract_function, prefix, name, table, offset,
+                    cached, start, metrics=None, compact=False):
+    """Write a generated machine and its checkpoint; return the run summary."""
     # Create subdirectory based on extractor type (e.g., domain, url)
     output_subdir = os.path.join(output_dir, prefix)
     os.makedirs(output_subdir, exist_ok=True)
 
-    output_json = os.path.join(output_subdir, f"{prefix}_{current_time}.json")
-
-    states, transitions = extract_states_and_transitions(
-        input_csv, extract_function)
-
-    # Extract unique triggers from transitions
-    unique_triggers = {trigger for _, _, trigger in transitions}
-
-    json_data = {
-        "WebActivityMachine": [
-            {
-                "name": f"{prefix}_{current_time}",
-                "initial_state": states[0] if states else "unknown",
-                "states": states,
-                # Include all unique triggers
-                "triggers": list(unique_triggers),
-                "transitions": [{"trigger": trigger, "source": src, "dest": dst} for src, dst, trigger in transitions],
-                "functions": {}
-            }
-        ]
+    output_json = os.path.join(output_subdir, f"{name}.json")
+
+    with stage_timer(metrics, "write"):
+        state_count, transition_count = write_machine_files(
+            output_json, name, table, None if compact else JSON_INDENT)
+        save_checkpoint(output_json, input_csv, extract_function, name, table, offset)
+        record_generated(output_json)
+    if metrics is not None:
+        metrics.count("states", state_count)
+        metrics.count("transitions", transition_count)
+
+    return {
+        "input": input_csv,
+        "output": output_json,
+        "rows_read": table.rows_read,
+        "rows_extracted": table.rows,
+        "matched": table.matched,
+        "states": state_count,
+        "transitions": transition_count,
+        "seconds": time.perf_counter() - start,
+        "cached": cached,
     }
 
-    with open(output_json, "w", encoding="utf-8") as json_file:
-        json.dump(json_data, json_file, indent=4)
 
-    print(f"JSON saved to {output_json}")
+# ==== BATCH ====
+
+
+def _slug(text):
+    """Make text safe for machine names, which are split on underscores."""
+    return re.sub(r"[^\w.-]|_", "-", text)
+
+
+def batch_name(prefix, input_csv):
+    """Return the deterministic machine name used for a CSV in a batch run."""
+    folder = os.path.basename(os.path.dirname(os.path.abspath(input_csv)))
+    stem = timeline_stem(input_csv)
+    return f"{prefix}_{_slug(folder)}_{_slug(stem)}"
+
+
+def _generate_batch_item(args):
+    input_csv, output_dir, extract_function, prefix = args
+    try:
+        return generate_json(input_csv, output_dir, extract_function, prefix,
+                             name=batch_name(prefix, input_csv), workers=1, collect_metrics=True)
+    except Exception as e:
+        print(f"Error processing {input_csv}: {e}")
+        return {"input": input_csv, "error": str(e)}
+
+
+def print_batch_summary(summaries):
+    """
+    Print one line per generated machine plus the totals.
+
+    Rows counts every row of the file, including those the source prefilter
+    dropped. Files whose extraction came from the cache are marked as such
+    and show the rows counted when the extraction was cached, or "-" if
+    that extraction did not count them.
+    """
+    done = [s for s in summaries if "error" not in s]
+    width = max([len("Total")] + [len(os.path.basename(s["input"])) for s in summaries])
+
+    def rows_read(summary):
+        return "-" if summary.get("rows_read") is None else summary["rows_read"]
+
+    print(f"\n{'File':<{width}}  {'Rows':>9}  {'Matched':>8}  {'States':>7}  {'Transitions':>11}  {'Time':>8}")
+    for s in summaries:
+        file = os.path.basename(s["input"])
+        if "error" in s:
+            print(f"{file:<{width}}  FAILED: {s['error']}")
+            continue
+        print(f"{file:<{width}}  {rows_read(s):>9}  {s['matched']:>8}  {s['states']:>7}  "
+              f"{s['transitions']:>11}  {s['seconds']:>7.2f}s{'  (cached)' if s.get('cached') else ''}")
+
+    totals = {key: sum(s[key] for s in done)
+              for key in ("matched", "states", "transitions", "seconds")}
+    totals["rows_read"] = sum(s["rows_read"] for s in done if s.get("rows_read") is not None)
+    cached = sum(1 for s in done if s.get("cached"))
+    print(f"{'Total':<{width}}  {totals['rows_read']:>9}  {totals['matched']:>8}  {totals['states']:>7}  "
+          f"{totals['transitions']:>11}  {totals['seconds']:>7.2f}s"
+          f"{f'  ({cached} cached)' if cached else ''}")
+
+
+def generate_batch(input_dir, output_dir, extract_function, prefix, workers=None):
+    """
+    Generate one JSON per timeline (CSV or JSONL, plain or compressed) in a
+    directory on a process pool.
+
+    Machines are named after the directory and CSV file, so repeated runs
+    overwrite the same outputs instead of colliding on the timestamp.
+
+    :param input_dir: Directory containing the CSV files.
+    :param output_dir: Directory to save the JSON files.
+    :param extract_function: Module-level function to extract states and triggers.
+    :param prefix: Prefix for the JSON filenames.
+    :param workers: Number of worker processes; defaults to the CPU count.
+    :return: List of summary dicts, in file name order.
+    """
+    csv_files = sorted(os.path.join(input_dir, f)
+                       for f in os.listdir(input_dir) if is_timeline_file(f))
+    if not csv_files:
+        print(f"No timeline files found in {input_dir}.")
+        return []
+
+    start = time.perf_counter()
+    jobs = [(csv_file, output_dir, extract_function, prefix)
+            for csv_file in csv_files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        summaries = list(executor.map(_generate_batch_item, jobs))
+
+    print_batch_summary(summaries)
+    print(f"Converted {len(summaries)} files in {time.perf_counter() - start:.2f}s")
+    return summaries
@@ -1,5 +1,5 @@
 import os
-from machine_source.processor import generate_json
+from machine_source.processor import generate_json, generate_jsons, generate_batch, find_checkpoint, update_json, is_timeline_file
 from machine_model.factory import MachineFactory
 from machine_simulation.runner import run_random_simulation, run_path_simulation, run_graph_simulation, run_max_depth_simulation
 from script.web_activity_script import web_activity_extract
@@ -8,12 +8,26 @@ from script.web_activity_script import web_activity_extract
 # ==== CONSTANTS ====
 RAW_DATA_DIR = "raw_data/"
 OUTPUT_DIR = "machine_source/"
+# Print per-stage pipeline metrics after generating a source, and keep
+# them as a .metrics JSON file next to the machine
+REPORT_METRICS = False
+WRITE_METRICS = False
+# Write generated machines as compact JSON instead of indenting them
+COMPACT_JSON = False
+# Run selected machines on the array-backed engine instead of transitions
+NATIVE_ENGINE = False
+# Build every machine up front on this many processes when listing them,
+# instead of building each one when it is selected
+BUILD_WORKERS = None
 SCRIPT_OPTIONS = {
     "1": ("Web Activity", web_activity_extract, "web_activity"),
 }
+ALL_SCRIPTS_OPTION = "A"
+ALL_SCRIPTS = "all"
 MENU_OPTIONS = {
     "1": "machines",
     "2": "sources",
+    "3": "batch",
     "0": None
 }
 SIMULATION_OPTIONS = {
@@ -32,6 +46,7 @@ def main_menu():
         print("\nMain Menu:")
         print("1. Generate Machines")
         print("2. Generate Sources")
+        print("3. Batch Generate Sources")
         print("0. Exit")
 
         choice = input("\nChoose an option (0 to exit): ")
@@ -43,7 +58,8 @@ def main_menu():
 def choose_machine(machines):
     print("\nAvailable Machines:")
     for idx, machine in enumerate(machines, 1):
-        print(f"{idx}. {machine.name} (Initial State: {machine.state})")
+        print(f"{idx}. {machine.name} (Initial State: {machine.state}, "
+              f"{machine.state_count} states, {machine.transition_count} transitions)")
     print("0. Back to Main Menu")
 
     while True:
@@ -68,7 +84,7 @@ def choose_simulation():
 
 
 def choose_csv():
-    csv_files = [f for f in os.listdir(RAW_DATA_DIR) if f.endswith(".csv")]
+    csv_files = [f for f in os.listdir(RAW_DATA_DIR) if is_timeline_file(f)]
     if not csv_files:
         print("No CSV files found in raw_data directory.")
         return None
@@ -87,11 +103,52 @@ def choose_csv():
         print("Invalid choice. Please select a valid file.")
 
 
-def choose_extractor():
+def choose_csv_directory():
+    csv_dirs = [root for root, _, files in sorted(os.walk(RAW_DATA_DIR))
+                if any(is_timeline_file(f) for f in files)]
+    if not csv_dirs:
+        print("No directories with CSV files found in raw_data directory.")
+        return None
+
+    while True:
+        print("\nAvailable CSV Directories:")
+        for idx, directory in enumerate(csv_dirs, 1):
+            print(f"{idx}. {directory}")
+        print("0. Back to Main Menu")
+
+        choice = input("\nChoose a directory (0 to go back): ")
+        if choice == "0":
+            return None
+        if choice.isdigit() and 1 <= int(choice) <= len(csv_dirs):
+            return csv_dirs[int(choice) - 1]
+        print("Invalid choice. Please select a valid directory.")
+
+
+def confirm(prompt):
+    while True:
+        choice = input(prompt).strip().lower()
+        if choice in ("y", "n"):
+            return choice == "y"
+        print("Invalid choice. Please answer y or n.")
+
+
+def choose_workers():
+    while True:
+        choice = input("\nNumber of worker processes (blank for all cores): ")
+        if not choice:
+            return None
+        if choice.isdigit() and int(choice) > 0:
+            return int(choice)
+        print("Invalid choice. Please enter a positive integer.")
+
+
+def choose_extractor(allow_all=False):
     while True:
         print("\nChoose an extraction method:")
         for key, (desc, _, _) in SCRIPT_OPTIONS.items():
             print(f"{key}. {desc}")
+        if allow_all:
+            print(f"{ALL_SCRIPTS_OPTION}. All Extraction Methods (single pass)")
         print("0. Back to CSV Selection")
 
         choice = input("\nEnter your choice (0 to go back): ")
@@ -99,6 +156,8 @@ def choose_extractor():
             return None
         if choice in SCRIPT_OPTIONS:
             return SCRIPT_OPTIONS[choice]
+        if allow_all and choice.upper() == ALL_SCRIPTS_OPTION:
+            return ALL_SCRIPTS
         print("Invalid choice. Please select a valid option.")
 
 # ==== CORE FUNCTIONS ====
@@ -125,13 +184,43 @@ def generate_source():
         if csv_file is None:
             return
 
-        extractor_choice = choose_extractor()
+        extractor_choice = choose_extractor(allow_all=True)
         if extractor_choice is None:
             continue
 
+        if extractor_choice == ALL_SCRIPTS:
+            print(f"\nGenerating sources using every extraction method on {csv_file}...\n")
+            generate_jsons(csv_file, OUTPUT_DIR, [(extract_function, prefix)
+                                                  for _, extract_function, prefix in SCRIPT_OPTIONS.values()],
+                           compact=COMPACT_JSON)
+            continue
+
         extractor_name, extract_function, prefix = extractor_choice
+        existing_json = find_checkpoint(csv_file, OUTPUT_DIR, prefix)
+        if existing_json and confirm(f"\nUpdate {existing_json} with rows appended to {csv_file}? (y/n): "):
+            print(f"\nUpdating source using {extractor_name} on {csv_file}...\n")
+            update_json(existing_json, extract_function, csv_file)
+            continue
+
         print(f"\nGenerating source using {extractor_name} on {csv_file}...\n")
-        generate_json(csv_file, OUTPUT_DIR, extract_function, prefix)
+        generate_json(csv_file, OUTPUT_DIR, extract_function, prefix,
+                      report_metrics=REPORT_METRICS, write_metrics=WRITE_METRICS, compact=COMPACT_JSON)
+
+
+def generate_batch_source():
+    while True:
+        csv_dir = choose_csv_directory()
+        if csv_dir is None:
+            return
+
+        extractor_choice = choose_extractor()
+        if extractor_choice is None:
+            continue
+
+        workers = choose_workers()
+        extractor_name, extract_function, prefix = extractor_choice
+        print(f"\nGenerating sources using {extractor_name} on every CSV in {csv_dir}...\n")
+        generate_batch(csv_dir, OUTPUT_DIR, extract_function, prefix, workers)
 
 
 # ==== MAIN FUNCTION ====
@@ -144,7 +233,7 @@ def main():
             break
 
         if selection == "machines":
-            machines = MachineFactory.build_machines()
+            machines = MachineFactory.build_machines(workers=BUILD_WORKERS, native=NATIVE_ENGINE)
             if not machines:
                 print("No machines were built.")
                 continue
@@ -153,11 +242,16 @@ def main():
                 selected_machine = choose_machine(machines)
                 if selected_machine is None:
                     break
-                run_machine_simulation(selected_machine)
+                machine = selected_machine.load(native=NATIVE_ENGINE)
+                if machine is not None:
+                    run_machine_simulation(machine)
 
         elif selection == "sources":
             generate_source()
 
+        elif selection == "batch":
+            generate_batch_source()
+
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,10 @@
 import re
 from urllib.parse import urlparse, parse_qs, unquote
 
+from script.url_rules import (DOWNLOAD_FILE, DOWNLOAD_URL, LEGACY_SEARCH_ENGINE, RESOURCE_EXCEPTION,
+                              RESOURCE_FILE, RESOURCE_HOST, extension_categories, host_rule,
+                              url_matches)
+
 
 def improved_search_extract(message):
     """
@@ -67,24 +71,8 @@ def is_download_url(url, path, query_params, message):
     Determines if the URL is likely to be a file download.
     This function checks multiple indicators to detect potential downloads.
     """
-    # Known file extensions for common downloadable files
-    download_extensions = [
-        # Documents
-        '.pdf', '.doc', '.docx', '.ppt', '.pptx', '.xls', '.xlsx', '.odt', '.ods', '.odp',
-        # Archives
-        '.zip', '.rar', '.7z', '.tar', '.gz', '.bz2',
-        # Executables and installers
-        '.exe', '.msi', '.apk', '.dmg', '.deb', '.rpm',
-        # Media
-        '.mp3', '.mp4', '.avi', '.mov', '.jpg', '.jpeg', '.png', '.gif', '.svg',
-        # Code/text
-        '.txt', '.csv', '.json', '.xml', '.html', '.js', '.css',
-        # Other common formats
-        '.iso', '.torrent'
-    ]
-
     # Check if path ends with a known download extension
-    if any(path.lower().endswith(ext) for ext in download_extensions):
+    if DOWNLOAD_FILE in extension_categories(path):
         return True
 
     # Check for common download-related URL patterns
@@ -96,11 +84,7 @@ def is_download_url(url, path, query_params, message):
         return True
 
     # Check for common download domains
-    download_domains = [
-        'download.', 'dl.', 'cdn.', 'mirror.', 'ftp.',
-        'github.com/.*?/releases/', 'sourceforge.net'
-    ]
-    if any(re.search(domain, url, re.IGNORECASE) for domain in download_domains):
+    if url_matches(DOWNLOAD_URL, url):
         return True
 
     # Check for download-related query parameters
@@ -206,24 +190,7 @@ def extract_filename_from_message(message):
 
 def identify_search_engine(netloc):
     """Identifies which search engine was used."""
-    search_engines = {
-        'google': ['google.'],
-        'bing': ['bing.'],
-        'yahoo': ['yahoo.'],
-        'duckduckgo': ['duckduckgo.', 'duck.com'],
-        'baidu': ['baidu.'],
-        'yandex': ['yandex.'],
-        'ask': ['ask.'],
-        'aol': ['aol.', 'search.aol.'],
-        'ecosia': ['ecosia.'],
-        'qwant': ['qwant.']
-    }
-
-    for engine, domains in search_engines.items():
-        if any(domain in netloc for domain in domains):
-            return engine
-
-    return "unknown"
+    return host_rule(LEGACY_SEARCH_ENGINE, netloc) or "unknown"
 
 
 def is_api_or_resource(netloc, path):
@@ -231,34 +198,16 @@ def is_api_or_resource(netloc, path):
     Determines if the URL is an API endpoint, CDN resource, or similar non-user-facing URL.
     Returns True if the URL should be excluded from analysis.
     """
-    # Exception list - always keep these domains even if they match resource patterns
-    exception_domains = [
-        'w3schools.com',
-        'github.com',
-        'stackoverflow.com',
-        'docs.python.org'
-    ]
-
-    # Check if domain is in exception list
-    if any(domain in netloc for domain in exception_domains):
+    # Check if domain is in exception list - always keep these domains even if they match resource patterns
+    if host_rule(RESOURCE_EXCEPTION, netloc):
         return False
 
     # Check file extensions that should be excluded (not downloads)
-    resource_extensions = [
-        '.js', '.css', '.woff', '.woff2', '.ttf', '.eot', '.map'
-    ]
-
-    if any(path.lower().endswith(ext) for ext in resource_extensions):
+    if RESOURCE_FILE in extension_categories(path):
         return True
 
     # Check for domains that are typically resources rather than user-facing
-    resource_domains = [
-        'static.', 'assets.', 'analytics.', 'tracking.', 'stats.',
-        'gateway.', 'r.', 'px.', 's.', 'c.', 'd.', 't.', 'tr.',
-        'beacon.', 'metrics.', 'logs.', 'events.'
-    ]
-
-    if any(domain in netloc for domain in resource_domains):
+    if host_rule(RESOURCE_HOST, netloc):
         return True
 
     # Check for resource paths
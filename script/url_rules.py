@@ -0,0 +1,307 @@
+"""
+URL Classification Rules
+
+One declarative table of the hosts, URLs and file extensions the web
+activity extractors recognize:
+- Search engines, as the current and the legacy extractors name them
+- Resource and API hosts, and the hosts exempt from that check
+- Download hosts and download or resource file extensions
+
+Rules keep the meaning the extractors have always given them: a host rule
+matches wherever its text appears in the lower-cased network location, so
+"google.com" also matches google.com.au and "s." matches news.example.com.
+At import time the host rules of each category are compiled into a trie of
+their characters, written out as one regular expression whose alternatives
+branch on the next character, so a host is scanned once in C however many
+rules are declared. URL rules are joined into one expression per category
+and extension rules into a single lookup table.
+"""
+
+import re
+
+# ==== CONSTANTS ====
+SEARCH_ENGINE = 'search_engine'
+LEGACY_SEARCH_ENGINE = 'legacy_search_engine'
+RESOURCE_HOST = 'resource_host'
+RESOURCE_EXCEPTION = 'resource_exception'
+DOWNLOAD_URL = 'download_url'
+DOWNLOAD_FILE = 'download_file'
+RESOURCE_FILE = 'resource_file'
+
+# ==== RULES ====
+# (category, value, host texts); when several rules of a category match,
+# the first declared wins
+HOST_RULES = (
+    (SEARCH_ENGINE, 'google', ('google.com',)),
+    (SEARCH_ENGINE, 'bing', ('bing.com',)),
+    (SEARCH_ENGINE, 'yahoo', ('yahoo.com',)),
+    (SEARCH_ENGINE, 'duckduckgo', ('duckduckgo.com',)),
+
+    # The legacy extractors recognize more engines, by any domain label
+    (LEGACY_SEARCH_ENGINE, 'google', ('google.',)),
+    (LEGACY_SEARCH_ENGINE, 'bing', ('bing.',)),
+    (LEGACY_SEARCH_ENGINE, 'yahoo', ('yahoo.',)),
+    (LEGACY_SEARCH_ENGINE, 'duckduckgo', ('duckduckgo.', 'duck.com')),
+    (LEGACY_SEARCH_ENGINE, 'baidu', ('baidu.',)),
+    (LEGACY_SEARCH_ENGINE, 'yandex', ('yandex.',)),
+    (LEGACY_SEARCH_ENGINE, 'ask', ('ask.',)),
+    (LEGACY_SEARCH_ENGINE, 'aol', ('aol.', 'search.aol.')),
+    (LEGACY_SEARCH_ENGINE, 'ecosia', ('ecosia.',)),
+    (LEGACY_SEARCH_ENGINE, 'qwant', ('qwant.',)),
+
+    # Always user-facing, even when they match a resource rule
+    (RESOURCE_EXCEPTION, True, (
+        'w3schools.com', 'github.com', 'stackoverflow.com', 'docs.python.org',
+    )),
+    (RESOURCE_HOST, True, (
+        'static.', 'assets.', 'analytics.', 'tracking.', 'stats.',
+        'gateway.', 'r.', 'px.', 's.', 'c.', 'd.', 't.', 'tr.',
+        'beacon.', 'metrics.', 'logs.', 'events.',
+    )),
+)
+
+# (category, regular expressions searched in the whole URL, ignoring case)
+URL_RULES = (
+    (DOWNLOAD_URL, (
+        r'download.', r'dl.', r'cdn.', r'mirror.', r'ftp.',
+        r'github.com/.*?/releases/', r'sourceforge.net',
+    )),
+)
+
+# (category, extensions a URL path may end with)
+EXTENSION_RULES = (
+    (DOWNLOAD_FILE, (
+        # Documents
+        '.pdf', '.doc', '.docx', '.ppt', '.pptx', '.xls', '.xlsx', '.odt', '.ods', '.odp',
+        # Archives
+        '.zip', '.rar', '.7z', '.tar', '.gz', '.bz2',
+        # Executables and installers
+        '.exe', '.msi', '.apk', '.dmg', '.deb', '.rpm',
+        # Media
+        '.mp3', '.mp4', '.avi', '.mov', '.jpg', '.jpeg', '.png', '.gif', '.svg',
+        # Code/text
+        '.txt', '.csv', '.json', '.xml', '.html', '.js', '.css',
+        # Other common formats
+        '.iso', '.torrent',
+    )),
+    (RESOURCE_FILE, (
+        '.js', '.css', '.woff', '.woff2', '.ttf', '.eot', '.map',
+    )),
+)
+
+
+# ==== COMPILATION ====
+
+def _trie_pattern(node):
+    """
+    Write a character trie node out as a regular expression.
+
+    Children are tried before the rule ending at the node, so the longest
+    rule starting at a position matches; since a rule ending deeper also
+    contains every rule ending above it, its group carries the lowest of
+    their priorities.
+
+    Args:
+        node (dict): Character to child node; None holds the rule group name
+
+    Returns:
+        str: The pattern matching any rule below the node
+    """
+    branches = []
+    for char, child in node.items():
+        if char is not None:
+            branches.append(re.escape(char) + _trie_pattern(child))
+    if None in node:
+        branches.append(f'(?P<{node[None]}>)')
+    if len(branches) == 1:
+        return branches[0]
+    return f"(?:{'|'.join(branches)})"
+
+
+def _group_host_rules(rules):
+    """
+    Group host rules by category, numbering them in declaration order.
+
+    Args:
+        rules (tuple): (category, value, texts) host rules
+
+    Returns:
+        dict: Category to a list of (priority, lower-cased text, value);
+            priorities count from 0 within each category
+    """
+    grouped = {}
+    for category, value, texts in rules:
+        category_rules = grouped.setdefault(category, [])
+        priority = category_rules[-1][0] + 1 if category_rules else 0
+        if not texts or not all(texts):
+            raise ValueError(f"Host rule {value!r} of {category} has an empty text")
+        for text in texts:
+            category_rules.append((priority, text.lower(), value))
+    return grouped
+
+
+def _compile_matcher(rules):
+    """
+    Compile host rules into one pattern over a trie of their characters.
+
+    Args:
+        rules (list): (priority, text, value) host rules
+
+    Returns:
+        tuple: (pattern, values) where values maps the group name of each
+            rule to its (priority, value)
+    """
+    trie = {}
+    for priority, text, value in rules:
+        node = trie
+        for char in text:
+            node = node.setdefault(char, {})
+        node.setdefault(None, (priority, value))
+
+    values = {}
+    _name_rules(trie, values, None)
+    return re.compile(_trie_pattern(trie)), values
+
+
+def _name_rules(node, values, inherited):
+    """Replace the rules of a trie by group names, keeping the lowest priority on each path."""
+    rule = node.get(None)
+    if rule is not None and (inherited is None or rule[0] < inherited[0]):
+        inherited = rule
+    if rule is not None:
+        name = f'r{len(values)}'
+        values[name] = inherited
+        node[None] = name
+    for char, child in node.items():
+        if char is not None:
+            _name_rules(child, values, inherited)
+
+
+def _compile_url_rules(rules):
+    """
+    Compile URL rules into one case-insensitive pattern per category.
+
+    Args:
+        rules (tuple): (category, expressions) URL rules
+
+    Returns:
+        dict: Category to its compiled pattern
+    """
+    expressions = {}
+    for category, patterns in rules:
+        expressions.setdefault(category, []).extend(patterns)
+    return {category: re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), re.IGNORECASE)
+            for category, patterns in expressions.items()}
+
+
+def _compile_extension_rules(rules):
+    """
+    Compile extension rules into a table of extension to categories.
+
+    Args:
+        rules (tuple): (category, extensions) extension rules
+
+    Returns:
+        dict: Lower-cased extension, dot included, to a frozenset of categories
+    """
+    extensions = {}
+    for category, patterns in rules:
+        for extension in patterns:
+            # Looked up by the text after the last dot of the path
+            if not extension.startswith('.') or '.' in extension[1:] or '/' in extension:
+                raise ValueError(f"Extension rule {extension!r} must be one dot and a suffix")
+            extensions.setdefault(extension.lower(), set()).add(category)
+    return {extension: frozenset(categories) for extension, categories in extensions.items()}
+
+
+HOST_RULES_BY_CATEGORY = _group_host_rules(HOST_RULES)
+HOST_MATCHERS = {category: _compile_matcher(rules)
+                 for category, rules in HOST_RULES_BY_CATEGORY.items()}
+URL_MATCHERS = _compile_url_rules(URL_RULES)
+EXTENSIONS = _compile_extension_rules(EXTENSION_RULES)
+NO_CATEGORIES = frozenset()
+
+# Matchers of the host rules declared before a priority, compiled when first needed
+_earlier_matchers = {}
+
+
+# ==== LOOKUPS ====
+
+def host_rule(category, netloc):
+    """
+    Find the first declared rule of a category appearing in a host.
+
+    Args:
+        category (str): The rule category
+        netloc (str): The lower-cased URL network location
+
+    Returns:
+        The value of the rule, or None if no rule of the category matches
+    """
+    pattern, values = HOST_MATCHERS[category]
+    match = pattern.search(netloc)
+    if match is None:
+        return None
+    priority, value = values[match.lastgroup]
+
+    # A rule declared earlier may still appear further right
+    while priority:
+        pattern, values = _earlier_matcher(category, priority)
+        match = pattern.search(netloc)
+        if match is None:
+            break
+        priority, value = values[match.lastgroup]
+    return value
+
+
+def _earlier_matcher(category, priority):
+    """Return the matcher of the rules of a category declared before a priority."""
+    key = (category, priority)
+    matcher = _earlier_matchers.get(key)
+    if matcher is None:
+        matcher = _earlier_matchers[key] = _compile_matcher(
+            [rule for rule in HOST_RULES_BY_CATEGORY[category] if rule[0] < priority])
+    return matcher
+
+
+def search_engine_for(netloc):
+    """
+    Identify the search engine of a host.
+
+    Args:
+        netloc (str): The lower-cased URL network location
+
+    Returns:
+        str or None: The engine name, or None if the host is not a known engine
+    """
+    return host_rule(SEARCH_ENGINE, netloc)
+
+
+def url_matches(category, url):
+    """
+    Check whether any URL rule of a category matches a URL.
+
+    Args:
+        category (str): The rule category
+        url (str): The full URL
+
+    Returns:
+        bool: True if a rule matches anywhere in the URL
+    """
+    return URL_MATCHERS[category].search(url) is not None
+
+
+def extension_categories(path):
+    """
+    Find the extension rule categories matching the end of a URL path.
+
+    Args:
+        path (str): The URL path
+
+    Returns:
+        frozenset: The matching categories, empty if none match
+    """
+    dot = path.rfind('.')
+    if dot < 0 or '/' in path[dot:]:
+        return NO_CATEGORIES
+    return EXTENSIONS.get(path[dot:].lower(), NO_CATEGORIES)
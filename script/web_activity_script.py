@@ -13,8 +13,42 @@ Chrome (with Type indicators) to provide consistent output.
 
 import os
 import re
+from functools import lru_cache
 from urllib.parse import urlparse, parse_qs, unquote
 
+from script.url_rules import search_engine_for
+
+# ==== CONSTANTS ====
+SUPPORTED_SOURCES = ('WEBHIST',)
+SUPPORTED_BROWSERS = ('Chrome History', 'Firefox History')
+
+# Browser flags (is_firefox, is_chrome) by source_long
+BROWSER_FLAGS = {
+    'Chrome History': (False, True),
+    'Firefox History': (True, False),
+}
+
+# Precompiled patterns of the hot path
+URL_PATTERN = re.compile(r'(https?://[^\s)]+)')
+TITLE_PATTERN = re.compile(r'\(([^)]+)\)')
+DOWNLOAD_NAME_PATTERN = re.compile(r'https?://[^\s]+\s+\(([^)]+)\)')
+CHROME_COMPLETE_PATTERN = re.compile(r"State: Complete\. Received \d+ of \d+ bytes\.")
+UNSAFE_FILENAME_PATTERN = re.compile(r'[^\w\.-]')
+UNSAFE_QUERY_PATTERN = re.compile(r'[^\w\s.,?!-]')
+
+# The batch extractor joins the messages of a batch with this separator and
+# scans them with one findall per pattern, matching one field per message.
+# URL_FIELD also splits each URL into its network location and its path up
+# to the query, parameters or fragment, the way urlparse splits http URLs.
+FIELD_SEPARATOR = '\x00'
+URL_FIELD = re.compile(
+    r'(?:[^\x00]*?(https?://(?=[^\s)\x00])([^\s)\x00/?#]*)([^\s)\x00?#]*)[^\s)\x00]*))?'
+    r'[^\x00]*\x00')
+TITLE_FIELD = re.compile(r'(?:[^\x00]*?\(([^)\x00]+)\))?[^\x00]*\x00')
+
+# Number of distinct URL classifications kept in memory, 0 disables the cache
+URL_CACHE_SIZE = 4096
+
 
 def web_activity_extract(row):
     """
@@ -30,12 +64,12 @@ def web_activity_extract(row):
     Returns:
         tuple or None: A tuple of (state, trigger) or None if no meaningful activity detected
     """
-    if row.get('source') != 'WEBHIST':
+    if row.get('source') not in SUPPORTED_SOURCES:
         return None
 
     # Check if this is from a supported browser
-    source_long = row.get('source_long', '')
-    if source_long not in ['Chrome History', 'Firefox History']:
+    browser_flags = BROWSER_FLAGS.get(row.get('source_long', ''))
+    if browser_flags is None:
         return None
 
     # Get message and timestamp description
@@ -46,36 +80,165 @@ def web_activity_extract(row):
         return None
 
     # Determine browser type
-    is_firefox = 'firefox' in source_long.lower()
-    is_chrome = 'chrome' in source_long.lower()
+    is_firefox, is_chrome = browser_flags
 
     # Extract URL
-    url_match = re.search(r'(https?://[^\s)]+)', message)
+    url_match = URL_PATTERN.search(message)
     if not url_match:
         return None
 
-    url = url_match.group(1)
-    parsed_url = urlparse(url)
-    netloc = parsed_url.netloc.lower()
-    path = parsed_url.path
-
-    # Extract the title if present
-    title = None
-    title_match = re.search(r'\(([^)]+)\)', message)
-    if title_match:
-        title = title_match.group(1)
-
     # CASE 1: Handle Downloads
     if _is_download_activity(message, is_firefox, is_chrome, timestamp_desc):
         return _extract_download_info(message, is_firefox, is_chrome)
 
+    # CASE 2 and 3 only read the message for the access markers and the
+    # title, so repeated visits of a URL are answered from the cache
+    title_match = TITLE_PATTERN.search(message)
+    title = title_match.group(1) if title_match else None
+    access_trigger = _access_trigger(message, is_firefox, is_chrome)
+    return _classify_url(url_match.group(1), access_trigger, title)
+
+
+# Let the processor skip rows from other sources before building row dicts
+web_activity_extract.sources = SUPPORTED_SOURCES
+web_activity_extract.source_longs = SUPPORTED_BROWSERS
+# Bump whenever the extracted states or triggers change, to invalidate caches
+web_activity_extract.version = "3"
+
+
+def _classify_url_uncached(url, access_trigger, title):
+    """
+    Classify a visited URL as a search or a general web access.
+
+    Args:
+        url (str): The visited URL
+        access_trigger (str): The access trigger from the browser markers
+        title (str): The page title if available
+
+    Returns:
+        tuple: (state, trigger)
+    """
+    parsed_url = urlparse(url)
+    netloc = parsed_url.netloc.lower()
+
     # CASE 2: Handle Searches
-    search_result = _extract_search_info(message, parsed_url, title)
+    search_result = _extract_search_info(parsed_url, netloc, title)
     if search_result:
         return search_result
 
     # CASE 3: Handle general web access
-    return _extract_web_access_info(message, netloc, path, is_firefox, is_chrome)
+    return _extract_web_access_info(netloc, parsed_url.path), access_trigger
+
+
+_classify_url = lru_cache(maxsize=URL_CACHE_SIZE)(_classify_url_uncached)
+
+
+def configure_url_cache(maxsize=URL_CACHE_SIZE):
+    """
+    Resize the URL classification cache, dropping its entries and stats.
+
+    Args:
+        maxsize (int): Number of classifications to keep, 0 disables caching
+            and None keeps every URL
+    """
+    global _classify_url
+    _classify_url = lru_cache(maxsize=maxsize)(_classify_url_uncached)
+
+
+def url_cache_info():
+    """
+    Report the URL classification cache statistics of this process.
+
+    Returns:
+        dict: hits, misses, maxsize, currsize and hit_rate
+    """
+    info = _classify_url.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "maxsize": info.maxsize,
+        "currsize": info.currsize,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+    }
+
+
+web_activity_extract.cache_info = url_cache_info
+
+
+def web_activity_extract_batch(columns):
+    """
+    Column-wise web_activity_extract over a batch of rows.
+
+    The messages of the batch are joined and scanned once for their URLs
+    and once for their titles. A plain http(s) URL that is not a search is
+    classified from the network location and path the scan split off,
+    once per distinct pair in the batch; downloads, searches and URLs that
+    urlparse might split differently go through the row-wise helpers, so
+    the results are identical.
+
+    Args:
+        columns (dict): Field name to a list of values, one per row, for
+            each name in web_activity_extract_batch.fields
+
+    Returns:
+        tuple: (states, triggers) lists holding None for rows without
+            meaningful activity
+    """
+    source_longs = columns['source_long']
+    messages = columns['message']
+    timestamp_descs = columns['timestamp_desc']
+    size = len(messages)
+    states = [None] * size
+    triggers = [None] * size
+
+    kept = [idx for idx, (source, source_long, message)
+            in enumerate(zip(columns['source'], source_longs, messages))
+            if source in SUPPORTED_SOURCES and source_long in BROWSER_FLAGS and message]
+    text = FIELD_SEPARATOR.join([messages[idx] for idx in kept]) + FIELD_SEPARATOR
+    if text.count(FIELD_SEPARATOR) != len(kept):
+        # A message holding the separator would shift every later field
+        for idx in kept:
+            extracted_data = web_activity_extract(
+                {'source': columns['source'][idx], 'source_long': source_longs[idx],
+                 'message': messages[idx], 'timestamp_desc': timestamp_descs[idx]})
+            if extracted_data:
+                states[idx], triggers[idx] = extracted_data
+        return states, triggers
+
+    sites = {}
+    for idx, (url, netloc, path), title in zip(kept, URL_FIELD.findall(text),
+                                               TITLE_FIELD.findall(text)):
+        if not url:
+            continue
+        message = messages[idx]
+        is_firefox, is_chrome = BROWSER_FLAGS[source_longs[idx]]
+
+        # CASE 1: Handle Downloads
+        if _is_download_activity(message, is_firefox, is_chrome, timestamp_descs[idx]):
+            states[idx], triggers[idx] = _extract_download_info(message, is_firefox, is_chrome)
+            continue
+
+        access_trigger = _access_trigger(message, is_firefox, is_chrome)
+        if ('/search' in path.lower() or ';' in path or '[' in netloc or ']' in netloc
+                or not netloc.isascii()):
+            # CASE 2, or a URL urlparse might split differently
+            states[idx], triggers[idx] = _classify_url(url, access_trigger, title or None)
+            continue
+
+        # CASE 3: Handle general web access
+        site = sites.get((netloc, path))
+        if site is None:
+            site = sites[(netloc, path)] = _extract_web_access_info(netloc.lower(), path)
+        states[idx], triggers[idx] = site, access_trigger
+
+    return states, triggers
+
+
+# Fields the batch extractor reads, and the batch entry point the processor
+# uses instead of calling web_activity_extract row by row
+web_activity_extract_batch.fields = ('source', 'source_long', 'message', 'timestamp_desc')
+web_activity_extract.batch = web_activity_extract_batch
 
 
 def _is_download_activity(message, is_firefox, is_chrome, timestamp_desc):
@@ -96,7 +259,7 @@ def _is_download_activity(message, is_firefox, is_chrome, timestamp_desc):
         return True
 
     # Check for Chrome-specific download completion
-    if is_chrome and timestamp_desc == "Start Time" and re.search(r"State: Complete\. Received \d+ of \d+ bytes\.", message):
+    if is_chrome and timestamp_desc == "Start Time" and CHROME_COMPLETE_PATTERN.search(message):
         return True
 
     return False
@@ -116,61 +279,49 @@ def _extract_download_info(message, is_firefox, is_chrome):
     """
     filename = "unknown_file"
 
-    if is_firefox:
-        # Firefox pattern: extract filename from parentheses after URL
-        # Pattern: "https://example.com/path/file (filename.ext)"
-        firefox_match = re.search(r'https?://[^\s]+\s+\(([^)]+)\)', message)
-        if firefox_match:
-            filename = firefox_match.group(1)
-
-    elif is_chrome:
-        # Chrome pattern: extract filename from full path in parentheses
-        # Pattern: "https://example.com/path/file (/path/to/downloads/filename.ext)."
-        chrome_match = re.search(r'https?://[^\s]+\s+\(([^)]+)\)', message)
-        if chrome_match:
-            full_path = chrome_match.group(1)
+    # Both browsers put the file in parentheses after the URL:
+    # Firefox "https://example.com/path/file (filename.ext)"
+    # Chrome "https://example.com/path/file (/path/to/downloads/filename.ext)."
+    name_match = DOWNLOAD_NAME_PATTERN.search(message)
+    if name_match:
+        if is_firefox:
+            filename = name_match.group(1)
+        elif is_chrome:
             # Extract just the filename from the full path
-            filename = os.path.basename(full_path)
+            filename = os.path.basename(name_match.group(1))
 
     # Clean filename of any URL encoding or special characters if needed
     filename = unquote(filename)
-    filename = re.sub(r'[^\w\.-]', '_', filename)
+    filename = UNSAFE_FILENAME_PATTERN.sub('_', filename)
 
     return filename, "downloaded_file"
 
 
-def _extract_search_info(message, parsed_url, title):
+def _extract_search_info(parsed_url, netloc, title):
     """
     Extract search query information from URLs that point to search engines.
 
     Args:
-        message (str): The browser history message
         parsed_url (ParseResult): The parsed URL
+        netloc (str): The lower-cased domain of the URL
         title (str): The page title if available
 
     Returns:
         tuple or None: (search_query, search_trigger) or None if not a search
     """
-    netloc = parsed_url.netloc.lower()
     path = parsed_url.path.lower()
+    if '/search' not in path:
+        return None
 
     # Check if this looks like a search engine URL
     is_search_url = False
     search_engine = "unknown"
 
-    # Check common search engines
-    if 'google.com' in netloc and '/search' in path:
-        is_search_url = True
-        search_engine = "google"
-    elif 'bing.com' in netloc and '/search' in path:
-        is_search_url = True
-        search_engine = "bing"
-    elif 'yahoo.com' in netloc and '/search' in path:
+    # Check known search engines
+    known_engine = search_engine_for(netloc)
+    if known_engine:
         is_search_url = True
-        search_engine = "yahoo"
-    elif 'duckduckgo.com' in netloc and '/search' in path:
-        is_search_url = True
-        search_engine = "duckduckgo"
+        search_engine = known_engine
     # Generic checks for other search engines
     elif '/search' in path and ('q=' in parsed_url.query or 'query=' in parsed_url.query or 'p=' in parsed_url.query):
         is_search_url = True
@@ -208,7 +359,7 @@ def _extract_search_info(message, parsed_url, title):
         search_query = unquote(query_params[query_param][0]).replace('+', ' ')
 
         # Clean the query to remove special characters but preserve spaces and punctuation
-        search_query = re.sub(r'[^\w\s.,?!-]', '', search_query)
+        search_query = UNSAFE_QUERY_PATTERN.sub('', search_query)
 
         # Return the query as state and engine-specific search trigger
         return search_query, f"performed_{search_engine}_search"
@@ -226,20 +377,16 @@ def _extract_search_info(message, parsed_url, title):
     return f"{netloc}/search", "performed_search"
 
 
-def _extract_web_access_info(message, netloc, path, is_firefox, is_chrome):
+def _extract_web_access_info(netloc, path):
     """
-    Format web access activity with domain and path information, determining
-    the access method based on browser-specific indicators.
+    Format web access activity with domain and path information.
 
     Args:
-        message (str): The browser history message
         netloc (str): The domain
         path (str): The URL path
-        is_firefox (bool): Whether this is a Firefox history entry
-        is_chrome (bool): Whether this is a Chrome history entry
 
     Returns:
-        tuple: (website_info, access_trigger)
+        str: The website info used as state
     """
     # Extract domain (remove www. prefix)
     domain = netloc
@@ -252,33 +399,44 @@ def _extract_web_access_info(message, netloc, path, is_firefox, is_chrome):
 
     # Create the state string
     if path_segments:
-        state = f"{domain}/{'/'.join(path_segments)}"
-    else:
-        state = domain
+        return f"{domain}/{'/'.join(path_segments)}"
+    return domain
+
 
-    # Determine the access method (trigger)
+def _access_trigger(message, is_firefox, is_chrome):
+    """
+    Determine the access method based on browser-specific indicators.
+
+    Args:
+        message (str): The browser history message
+        is_firefox (bool): Whether this is a Firefox history entry
+        is_chrome (bool): Whether this is a Chrome history entry
+
+    Returns:
+        str: The access trigger
+    """
     if is_firefox:
         # Firefox uses explicit transition types
         if 'Transition: TYPED' in message:
-            return state, "accessed_website_direct"
+            return "accessed_website_direct"
         elif 'Transition: LINK' in message:
-            return state, "accessed_website_link"
+            return "accessed_website_link"
         elif 'Transition: REDIRECT' in message:
-            return state, "accessed_website_redirect"
+            return "accessed_website_redirect"
         else:
             # Default for Firefox
-            return state, "accessed_website"
+            return "accessed_website"
     elif is_chrome:
         # Chrome uses Type: indicators
         if 'Type: [GENERATED' in message:
-            return state, "accessed_website_direct"
+            return "accessed_website_direct"
         elif 'Type: [LINK' in message:
-            return state, "accessed_website_link"
+            return "accessed_website_link"
         elif 'Type: [REDIRECT' in message:
-            return state, "accessed_website_redirect"
+            return "accessed_website_redirect"
         else:
             # Default for Chrome
-            return state, "accessed_website"
+            return "accessed_website"
     else:
         # Generic case for unknown browser type
-        return state, "accessed_website"
+        return "accessed_website"